@@ -22,6 +22,8 @@ def create_app(config_class=None):
     app.config['SECRET_KEY'] = 'Your Secret Key Here'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config_class is not None:
+        app.config.from_object(config_class)
     
     # Initialize extensions with app
     db.init_app(app)
@@ -34,6 +36,10 @@ def create_app(config_class=None):
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
 
+    # current_user is a cached read-only snapshot of the signed-in user
+    from app import users
+    users.init_app(app, login_manager)
+
     # Configure logging
     if not os.path.exists('logs'):
         os.mkdir('logs')
@@ -52,4 +58,37 @@ def create_app(config_class=None):
     with app.app_context():
         db.create_all()
 
+    # Stored post excerpts and word counts (added to older databases)
+    from app import excerpts
+    excerpts.init_app(app, db)
+
+    # Keyset pagination: count cache and indexes for older databases
+    from app import pagination
+    pagination.init_app(app, db)
+
+    # Page cache for anonymous visitors and template fragments, invalidated by Post/User writes.
+    # 'disk' shares versions between worker processes; 'memory' is for single-process servers only.
+    app.config.setdefault('PAGE_CACHE', os.environ.get('PAGE_CACHE', 'disk'))
+    app.config.setdefault('PAGE_CACHE_PATH', os.environ.get('PAGE_CACHE_PATH', 'page_cache.db'))
+    from app import cache
+    cache.init_app(app)
+
+    # Profile pictures are resized by a pool of worker processes, off the request path
+    from app import images
+    images.init_app(app, db)
+
+    # Profile pictures are stored by content hash and deleted once no user references them
+    from app import avatars
+    avatars.init_app(app, db)
+
+    # Full-text search index over posts
+    from app import search
+    search.init_app(app, db)
+
+    # Opt-in per-request phase timings in a Server-Timing header
+    app.config['INSTRUMENTATION'] = bool(os.environ.get('INSTRUMENTATION'))
+    if app.config['INSTRUMENTATION']:
+        from app.instrumentation import init_app as init_instrumentation
+        init_instrumentation(app, db, bcrypt, mail)
+
     return app
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+Content-addressed profile pictures.
+
+The image pipeline names every picture after the SHA-256 of its 125px JPEG
+(<hash>.jpg, with <hash>-<size>.jpg/.webp beside it), so the same picture
+is stored once however many users upload it, and a name never changes
+content. /avatars/<name> is therefore served as immutable for a year.
+
+A picture's reference count is the number of users whose image_file names
+it, counted through the index on that column. When a user changes picture
+or is deleted, the old name is released after the transaction commits and
+its files are removed if nothing references it any more. PROTECTED names
+are never removed, and neither is a file younger than AVATAR_GC_GRACE
+seconds, which a finishing upload of the same picture may be about to
+claim. Such a name is released again once its grace period has passed, so
+a picture replaced right after it was uploaded does not linger; `flask
+gc-avatars` sweeps up whatever is left over after a restart.
+
+`flask dedupe-avatars` moves a directory of randomly named uploads over to
+content-addressed names once.
+"""
+import glob
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from collections import defaultdict
+
+import click
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+# Files templates and the User model refer to by name
+PROTECTED = frozenset({'default.jpg', 'admin.jpg'})
+
+# Seconds an unreferenced file is kept after it was written
+GC_GRACE = 300
+
+# Browser cache lifetime of a content-addressed picture
+MAX_AGE = 365 * 24 * 3600
+
+# <stem>-<size>.<ext> files belong to <stem>.jpg
+_VARIANT = re.compile(r'-\d+$')
+
+
+def content_name(path, extension='.jpg'):
+    """The name the file at path is stored under: 16 hex digits of its SHA-256 plus extension."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16] + extension
+
+
+def _directory():
+    return os.path.join(current_app.root_path, 'static', 'profile_pics')
+
+
+def _pictures(directory):
+    """Names in directory that users can point at, leaving out the size variants."""
+    return [
+        name for name in sorted(os.listdir(directory))
+        if os.path.isfile(os.path.join(directory, name)) and not _VARIANT.search(os.path.splitext(name)[0])
+    ]
+
+
+class DeferredReleases:
+    """Names skipped for being inside their grace period, released again by a timer once it has passed."""
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self._names = set()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, names, delay):
+        with self._lock:
+            self._names.update(names)
+            if self._timer is None:
+                self._timer = threading.Timer(delay, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            names, self._names, self._timer = self._names, set(), None
+        with self.app.app_context():
+            try:
+                # Names still young (re-uploaded meanwhile) are deferred again
+                release(self.db, names)
+            except Exception:
+                self.app.logger.exception('Releasing deferred pictures failed')
+
+
+def release(db, names, grace=None):
+    """Delete each picture in names, with its variants, that no user references; returns the names deleted."""
+    if grace is None:
+        grace = current_app.config.get('AVATAR_GC_GRACE', GC_GRACE)
+    directory = _directory()
+    deleted = []
+    young = {}
+    with db.engine.connect() as connection:
+        for name in sorted(set(names) - PROTECTED):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            age = time.time() - os.path.getmtime(path)
+            if age < grace:
+                young[name] = grace - age
+                continue
+            references = connection.execute(
+                text('SELECT count(*) FROM user WHERE image_file = :name'), {'name': name}
+            ).scalar()
+            if references:
+                continue
+            stem = os.path.splitext(name)[0]
+            for file in [path] + glob.glob(os.path.join(directory, glob.escape(stem) + '-*')):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+            deleted.append(name)
+    deferred = current_app.extensions.get('avatar_releases')
+    if young and deferred is not None:
+        deferred.add(young, max(young.values()) + 1)
+    return deleted
+
+
+def sweep(db, grace=None):
+    """Release every picture in the directory; only the unreferenced ones are deleted."""
+    return release(db, _pictures(_directory()), grace)
+
+
+def dedupe(db, dry_run=False):
+    """
+    Store every picture under its content-addressed name and point users at
+    it, deleting the byte-identical copies. A group of copies that includes
+    a PROTECTED file is merged into that file instead. Returns a dict of
+    old name -> new name.
+    """
+    directory = _directory()
+    groups = defaultdict(list)
+    for name in _pictures(directory):
+        extension = os.path.splitext(name)[1].lower().replace('.jpeg', '.jpg')
+        groups[content_name(os.path.join(directory, name), extension)].append(name)
+
+    renames = {}
+    for canonical, names in groups.items():
+        target = next((name for name in names if name in PROTECTED), canonical)
+        for name in names:
+            if name != target and name not in PROTECTED:
+                renames[name] = target
+        if not dry_run and not os.path.exists(os.path.join(directory, target)):
+            shutil.copyfile(os.path.join(directory, names[0]), os.path.join(directory, target))
+    if dry_run or not renames:
+        return renames
+
+    # Users move to the new names in one transaction, before any old file is deleted
+    db.session.execute(
+        text('UPDATE user SET image_file = :new WHERE image_file = :old'),
+        [{'old': old, 'new': new} for old, new in renames.items()],
+    )
+    db.session.commit()
+    for old in renames:
+        os.remove(os.path.join(directory, old))
+    return renames
+
+
+def _release_later(session, name):
+    if session is not None and name:
+        session.info.setdefault('released_avatars', set()).add(name)
+
+
+def _after_commit(session):
+    names = session.info.pop('released_avatars', None)
+    if names and has_app_context():
+        from app import db
+        release(db, names)
+
+
+def _after_rollback(session):
+    session.info.pop('released_avatars', None)
+
+
+def init_app(app, db):
+    """Add the gc-avatars and dedupe-avatars commands and hook User picture changes and deletes once."""
+    from app.models import User
+
+    app.extensions['avatar_releases'] = DeferredReleases(app, db)
+
+    @app.cli.command('gc-avatars')
+    @click.option('--grace', type=int, default=None, help='Keep unreferenced files younger than this many seconds.')
+    def gc_avatars(grace):
+        """Delete profile pictures no user references."""
+        deleted = sweep(db, grace)
+        click.echo(f'Deleted {len(deleted)} unreferenced pictures.')
+
+    @app.cli.command('dedupe-avatars')
+    @click.option('--dry-run', is_flag=True, help='Print the renames without making them.')
+    def dedupe_avatars(dry_run):
+        """Rename profile pictures to their content hash, merging identical copies."""
+        renames = dedupe(db, dry_run)
+        for old, new in sorted(renames.items()):
+            click.echo(f'{old} -> {new}')
+        click.echo(f'{"Would merge" if dry_run else "Merged"} {len(renames)} pictures '
+                   f'into {len(set(renames.values()))}.')
+
+    if getattr(User, '_avatars_counted', False):
+        return
+    # Models are module-level, so hook them once even if create_app runs again
+    User._avatars_counted = True
+
+    @event.listens_for(User, 'after_update')
+    def picture_changed(mapper, connection, user):
+        for old in inspect(user).attrs.image_file.history.deleted:
+            _release_later(object_session(user), old)
+
+    @event.listens_for(User, 'after_delete')
+    def user_deleted(mapper, connection, user):
+        _release_later(object_session(user), user.image_file)
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
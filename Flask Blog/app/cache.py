@@ -0,0 +1,317 @@
+"""
+Rendered-page and fragment cache.
+
+Views wrapped in @cached_page are served from the cache to anonymous
+visitors, with an ETag so a repeat visit can be answered 304 Not Modified.
+Templates can cache part of a page for everyone with
+
+    {% call cached_fragment('articles') %}...{% endcall %}
+
+Entries are invalidated by tags rather than by time. Every Post and User
+loaded while a page is built tags it ('post:<id>', 'user:<id>'), and views
+add the collections they list ('posts', 'posts-by:<user id>') with
+depends(). Each tag has a version. An entry keeps the versions it was
+built from and is stale once any of them changes. Post and User writes bump
+their tags after the transaction commits. Versions are captured when the
+data is read, so a page rendered from rows read before a commit is never
+served afterwards.
+
+PAGE_CACHE selects the backend: 'disk' (the default, a SQLite file shared by
+every worker process) or 'memory' (per process, LRU); empty disables
+caching. A write only bumps versions in the process that made it, so
+'memory' must only be used when the app runs as a single process.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+# Entries kept by either backend before the oldest are dropped
+MAX_ENTRIES = 1000
+
+# Tag versions either backend keeps, per entry it may hold
+VERSIONS_PER_ENTRY = 10
+
+
+def _token():
+    return os.urandom(8).hex()
+
+
+class MemoryBackend:
+    """
+    Entries and tag versions in this process, least recently used entries
+    evicted first. Once more than max_versions tags have been bumped, both
+    are cleared together: dropping only a version would let an entry built
+    before that bump match the missing version again.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_versions=None):
+        self.max_entries = max_entries
+        self.max_versions = max_versions or max_entries * VERSIONS_PER_ENTRY
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags):
+        with self._lock:
+            return {tag: self._versions.get(tag) for tag in tags}
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = _token()
+            if len(self._versions) > self.max_versions:
+                self._entries.clear()
+                self._versions.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class DiskBackend:
+    """
+    Entries and tag versions in a SQLite file, so every worker process
+    shares them. Versions past max_versions are cleared together with the
+    entries, as in MemoryBackend.
+    """
+
+    def __init__(self, path='page_cache.db', max_entries=MAX_ENTRIES, max_versions=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_versions = max_versions or max_entries * VERSIONS_PER_ENTRY
+        self._local = threading.local()
+        self._writes = 0
+        self._bumps = 0
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT NOT NULL, '
+            'mimetype TEXT NOT NULL, tags TEXT NOT NULL, stored REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS entries_stored ON entries (stored)')
+        connection.execute('CREATE TABLE IF NOT EXISTS versions (tag TEXT PRIMARY KEY, version TEXT NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, isolation_level=None, timeout=10)
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT body, etag, mimetype, tags FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'body': row[0], 'etag': row[1], 'mimetype': row[2], 'tags': json.loads(row[3])}
+
+    def set(self, key, entry):
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO entries (key, body, etag, mimetype, tags, stored) VALUES (?, ?, ?, ?, ?, ?)',
+            (key, entry['body'], entry['etag'], entry['mimetype'], json.dumps(entry['tags']), time.time()),
+        )
+        # Trim now and then rather than counting on every write
+        self._writes += 1
+        if self._writes % 100 == 0:
+            connection.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY stored DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+
+    def versions(self, tags):
+        tags = list(tags)
+        found = dict(self._connection().execute(
+            f'SELECT tag, version FROM versions WHERE tag IN ({", ".join("?" * len(tags))})', tags
+        )) if tags else {}
+        return {tag: found.get(tag) for tag in tags}
+
+    def bump(self, tags):
+        connection = self._connection()
+        connection.executemany(
+            'INSERT OR REPLACE INTO versions (tag, version) VALUES (?, ?)', [(tag, _token()) for tag in tags]
+        )
+        # Checked now and then, like the entry trim
+        self._bumps += 1
+        if self._bumps % 100 == 0:
+            if connection.execute('SELECT count(*) FROM versions').fetchone()[0] > self.max_versions:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.execute('DELETE FROM entries')
+                connection.execute('DELETE FROM versions')
+                connection.execute('COMMIT')
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM entries')
+        connection.execute('DELETE FROM versions')
+
+
+def _backend():
+    return current_app.extensions.get('page_cache') if has_app_context() else None
+
+
+def depends(*tags):
+    """Record that the page being built depends on tags, at their current versions."""
+    if not has_request_context():
+        return
+    recorded = g.get('cache_tags')
+    backend = _backend()
+    if recorded is None or backend is None:
+        return
+    missing = [tag for tag in tags if tag not in recorded]
+    if missing:
+        recorded.update(backend.versions(missing))
+
+
+def _fresh(backend, entry):
+    return entry is not None and backend.versions(entry['tags']) == entry['tags']
+
+
+def _anonymous():
+    # Checked on the session itself, so serving a hit never loads the user
+    return '_user_id' not in session and 'remember_token' not in request.cookies and '_flashes' not in session
+
+
+def cached_page(view):
+    """Serve view from the cache to anonymous GETs, storing successful responses with an ETag."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        backend = _backend()
+        if backend is None or request.method != 'GET':
+            return view(*args, **kwargs)
+        g.cache_tags = {}
+        if not _anonymous():
+            return view(*args, **kwargs)
+
+        key = f'page:{request.full_path}'
+        entry = backend.get(key)
+        if _fresh(backend, entry):
+            response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+            response.headers['X-Cache'] = 'HIT'
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough or '_flashes' in session:
+                return response
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+                'mimetype': response.mimetype,
+                'tags': dict(g.cache_tags),
+            }
+            backend.set(key, entry)
+            response.headers['X-Cache'] = 'MISS'
+        response.set_etag(entry['etag'])
+        # Browsers may keep the page but must revalidate it, which costs a 304 at most
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return wrapper
+
+
+def cached_fragment(name, caller):
+    """Jinja call block: render the body once per name and URL until a tag of the page changes."""
+    backend = _backend()
+    recorded = g.get('cache_tags')
+    if backend is None or recorded is None:
+        return caller()
+    key = f'fragment:{name}:{request.full_path}'
+    entry = backend.get(key)
+    if _fresh(backend, entry):
+        return Markup(entry['body'].decode())
+    body = str(caller())
+    backend.set(key, {'body': body.encode(), 'etag': '', 'mimetype': 'text/html', 'tags': dict(recorded)})
+    return Markup(body)
+
+
+def _record_load(kind):
+    def on_load(target, context):
+        depends(f'{kind}:{target.id}')
+    return on_load
+
+
+def _invalidate(session, *tags):
+    session.info.setdefault('cache_invalidations', set()).update(tags)
+
+
+def _after_commit(session):
+    tags = session.info.pop('cache_invalidations', None)
+    backend = _backend()
+    if tags and backend is not None:
+        backend.bump(tags)
+        if 'posts' in tags and 'pagination_counts' in current_app.extensions:
+            current_app.extensions['pagination_counts'].clear()
+
+
+def _after_rollback(session):
+    session.info.pop('cache_invalidations', None)
+
+
+def init_app(app):
+    """Pick the backend from PAGE_CACHE and hook Post/User loads and writes once."""
+    from app.models import Post, User
+
+    kind = app.config.get('PAGE_CACHE')
+    max_entries = app.config.get('PAGE_CACHE_MAX_ENTRIES', MAX_ENTRIES)
+    if kind == 'memory':
+        app.extensions['page_cache'] = MemoryBackend(max_entries)
+    elif kind == 'disk':
+        app.extensions['page_cache'] = DiskBackend(app.config.get('PAGE_CACHE_PATH', 'page_cache.db'), max_entries)
+    elif kind:
+        raise ValueError(f'Unknown PAGE_CACHE backend: {kind}')
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
+
+    if getattr(Post, '_page_cached', False):
+        return
+    # Models are module-level, so hook them once even if create_app runs again
+    Post._page_cached = True
+    event.listen(Post, 'load', _record_load('post'))
+    event.listen(User, 'load', _record_load('user'))
+
+    @event.listens_for(Post, 'after_insert')
+    def post_inserted(mapper, connection, post):
+        _invalidate(object_session(post), 'posts', f'posts-by:{post.user_id}')
+
+    @event.listens_for(Post, 'after_update')
+    def post_updated(mapper, connection, post):
+        _invalidate(object_session(post), f'post:{post.id}')
+
+    @event.listens_for(Post, 'after_delete')
+    def post_deleted(mapper, connection, post):
+        _invalidate(object_session(post), f'post:{post.id}', 'posts', f'posts-by:{post.user_id}')
+
+    @event.listens_for(User, 'after_update')
+    def user_updated(mapper, connection, user):
+        _invalidate(object_session(user), f'user:{user.id}')
+
+    @event.listens_for(User, 'after_delete')
+    def user_deleted(mapper, connection, user):
+        _invalidate(object_session(user), f'user:{user.id}', 'posts', f'posts-by:{user.id}')
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,45 @@
+"""
+Stored post excerpts and word counts.
+
+Post.excerpt and Post.word_count are filled in by models.summarize whenever
+a post's content is set. Databases created before the columns existed get
+them added and backfilled on startup; `flask backfill-excerpts` recomputes
+every post.
+"""
+import click
+from sqlalchemy import text
+
+from app.models import summarize
+
+
+def backfill(db, batch=1000):
+    """Recompute excerpt and word_count for every post; returns the number of posts updated."""
+    connection = db.session.connection()
+    result = connection.execute(text('SELECT id, content FROM post'))
+    count = 0
+    while rows := result.fetchmany(batch):
+        updates = []
+        for row in rows:
+            excerpt, word_count = summarize(row.content)
+            updates.append({'id': row.id, 'excerpt': excerpt, 'word_count': word_count})
+        connection.execute(text('UPDATE post SET excerpt = :excerpt, word_count = :word_count WHERE id = :id'), updates)
+        count += len(rows)
+    db.session.commit()
+    summarize.cache_clear()
+    return count
+
+
+def init_app(app, db):
+    """Add the columns to an older post table (backfilling them) and add `flask backfill-excerpts`."""
+    with app.app_context():
+        columns = {row.name for row in db.session.execute(text('PRAGMA table_info(post)'))}
+        if 'excerpt' not in columns:
+            db.session.execute(text("ALTER TABLE post ADD COLUMN excerpt TEXT NOT NULL DEFAULT ''"))
+            db.session.execute(text('ALTER TABLE post ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0'))
+            db.session.commit()
+            backfill(db)
+
+    @app.cli.command('backfill-excerpts')
+    def backfill_excerpts():
+        """Recompute the stored excerpt and word count of every post."""
+        click.echo(f'Updated {backfill(db)} posts')
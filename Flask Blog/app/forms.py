@@ -4,7 +4,7 @@ from flask_login import current_user
 from flask_ckeditor import CKEditorField
 from wtforms import StringField, BooleanField, SubmitField, PasswordField, TextAreaField
 from wtforms.validators import DataRequired, Length, EqualTo, Email, ValidationError
-from app.models import User
+from app.models import User, summarize
 
 class SearchForm(FlaskForm):
     search = StringField('Search', validators=[DataRequired()])
@@ -71,7 +71,7 @@ class PostForm(FlaskForm):
     def validate_content(self, content):
         # Custom validation for minimum word count (1000 words)
         min_word_count = 500
-        words = len(content.data.split())
+        words = summarize(content.data)[1]
         if words < min_word_count:
             raise ValidationError(f'Content must be at least {min_word_count} words.')
 
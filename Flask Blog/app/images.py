@@ -0,0 +1,186 @@
+"""
+Profile picture processing off the request path.
+
+/account only writes the upload to a staging directory and queues a job; a
+pool of worker processes decodes it and writes every size in SIZES as JPEG
+and WebP, without EXIF, ICC or other metadata. The account keeps its
+current picture (the default avatar for a new account) until the job
+finishes, then switches to the new one in a single commit.
+
+Files are named after the content hash of the 125px JPEG (see
+app.avatars), so identical pictures share one set of files:
+
+    <hash>.jpg               125px, the file User.image_file points at
+    <hash>-<size>.jpg/.webp  every size in SIZES
+
+Templates show them through the avatar macro (templates/avatar.html): a
+<picture> offering the WebP and JPEG variants at 1x and 2x, falling back to
+the single file for pictures without variants (the PROTECTED ones and
+uploads from before the pipeline).
+
+JPEGs are decoded in draft mode, letting libjpeg scale them by 1/2, 1/4 or
+1/8 while decoding, so a 20 megapixel photo is never fully decoded for a
+250px avatar.
+"""
+import multiprocessing
+import os
+import secrets
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps
+
+from app.avatars import content_name
+
+# Square bounding boxes generated for each picture: article avatar, account page, 2x account
+SIZES = (65, 125, 250)
+
+# The size saved as <stem>.jpg for the templates
+DEFAULT_SIZE = 125
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+
+def process(source, directory, sizes=SIZES, draft=True):
+    """Write every size of the image at source into directory; returns the picture's content-addressed name."""
+    # Written under a scratch stem first, since the name depends on the encoded output
+    scratch = '.' + secrets.token_hex(8)
+    with Image.open(source) as image:
+        if draft and image.format == 'JPEG':
+            # Pick the smallest decoder scale that still covers the largest size
+            image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        # Nothing from the upload's EXIF, XMP or ICC data is written back
+        image.info = {}
+
+        written = []
+        for size in sorted(sizes, reverse=True):
+            # Each size is reduced from the previous, larger one
+            image.thumbnail((size, size), Image.LANCZOS)
+            for extension, options in (('jpg', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}),
+                                       ('webp', {'quality': WEBP_QUALITY, 'method': 4})):
+                image.save(os.path.join(directory, f'{scratch}-{size}.{extension}'), **options)
+                written.append(f'-{size}.{extension}')
+
+    shutil.copyfile(os.path.join(directory, f'{scratch}-{DEFAULT_SIZE}.jpg'), os.path.join(directory, f'{scratch}.jpg'))
+    written.append('.jpg')
+    name = content_name(os.path.join(directory, f'{scratch}.jpg'))
+    stem = os.path.splitext(name)[0]
+    for suffix in written:
+        # An existing copy of the same picture is replaced by identical bytes, refreshing its mtime for the GC
+        os.replace(os.path.join(directory, scratch + suffix), os.path.join(directory, stem + suffix))
+    return name
+
+
+# Stems known to have variants; names are content-addressed, so the answer never changes
+_with_variants = set()
+
+
+def avatar_sources(name, size):
+    """
+    srcset strings {'webp': ..., 'jpg': ...} for picture name shown at size
+    px, at 1x and (from the next larger size) 2x; None if it has no variants.
+    """
+    if size not in SIZES:
+        return None
+    stem = os.path.splitext(name)[0]
+    if stem not in _with_variants:
+        directory = os.path.join(current_app.root_path, 'static', 'profile_pics')
+        if not os.path.exists(os.path.join(directory, f'{stem}-{max(SIZES)}.webp')):
+            return None
+        _with_variants.add(stem)
+    densities = [(size, '1x')] + [(larger, '2x') for larger in sorted(SIZES) if larger > size][:1]
+    return {
+        extension: ', '.join(
+            f"{url_for('main.avatar', name=f'{stem}-{width}.{extension}')} {density}" for width, density in densities
+        )
+        for extension in ('webp', 'jpg')
+    }
+
+
+class ImagePipeline:
+    """Queues picture jobs on a pool of worker processes and applies the result when each finishes."""
+
+    def __init__(self, app, db, workers, staging, directory):
+        self.app = app
+        self.db = db
+        self.workers = workers
+        self.staging = staging
+        self.directory = directory
+        # user id -> job id of the latest upload, so an older job finishing late is ignored
+        self.pending = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        os.makedirs(staging, exist_ok=True)
+
+    def _pool(self, replace=False):
+        with self._lock:
+            if self._executor is None or replace:
+                # Spawned, not forked: the web process has threads and open database connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, user_id, upload):
+        """Stage an uploaded FileStorage for user_id and queue it; returns the job's future."""
+        job = secrets.token_hex(8)
+        _, extension = os.path.splitext(upload.filename)
+        source = os.path.join(self.staging, job + extension.lower())
+        upload.save(source)
+        with self._lock:
+            self.pending[user_id] = job
+        try:
+            future = self._pool().submit(process, source, self.directory)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory); start a new pool rather than failing every upload
+            future = self._pool(replace=True).submit(process, source, self.directory)
+        future.add_done_callback(lambda done: self._finished(done, user_id, job, source))
+        return future
+
+    def _finished(self, future, user_id, job, source):
+        try:
+            os.remove(source)
+        except OSError:
+            pass
+        with self._lock:
+            current = self.pending.get(user_id) == job
+            if current:
+                del self.pending[user_id]
+        with self.app.app_context():
+            if future.exception() is not None:
+                self.app.logger.error(f'Processing picture {job} failed', exc_info=future.exception())
+            elif current:
+                from app.models import User
+                try:
+                    user = self.db.session.get(User, user_id)
+                    if user is not None:
+                        # The replaced picture is released when this commits
+                        user.image_file = future.result()
+                        self.db.session.commit()
+                finally:
+                    self.db.session.remove()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def init_app(app, db):
+    """Create the app's pipeline; IMAGE_WORKERS sets the pool size, IMAGE_STAGING_DIR where uploads wait."""
+    pipeline = ImagePipeline(
+        app,
+        db,
+        app.config.get('IMAGE_WORKERS') or min(os.cpu_count() or 1, 4),
+        app.config.get('IMAGE_STAGING_DIR') or os.path.join(app.instance_path, 'uploads'),
+        os.path.join(app.root_path, 'static', 'profile_pics'),
+    )
+    app.extensions['images'] = pipeline
+    app.add_template_global(avatar_sources)
+    return pipeline
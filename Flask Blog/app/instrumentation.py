@@ -0,0 +1,111 @@
+"""
+Opt-in per-request timing for the blog.
+
+Each request records the time it spends in SQL (timed with SQLAlchemy
+cursor events), Jinja rendering, bcrypt and outgoing mail, and sends the
+totals and call counts back in a Server-Timing header, which the browser's
+network panel shows per request. Enable it with INSTRUMENTATION=1 in the
+environment.
+
+The blog runs as a single small process, so it stops there. Aggregated
+Prometheus metrics and the sampling profiler live only in the finance
+app's instrumentation module.
+"""
+import contextvars
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+
+from flask import before_render_template, request, template_rendered
+from sqlalchemy import event
+
+_current = contextvars.ContextVar('instrumentation', default=None)
+
+
+class Recorder:
+    """Phase timings collected during one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.seconds = defaultdict(float)
+        self.counts = Counter()
+        self.renders = []
+
+    def add(self, phase, seconds):
+        self.seconds[phase] += seconds
+        self.counts[phase] += 1
+
+
+def record(phase, seconds):
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add(phase, seconds)
+
+
+def timed_call(phase, function):
+    """Wrap function so each call is charged to phase of the current request."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(phase, time.perf_counter() - start)
+    return wrapper
+
+
+def init_app(app, db, bcrypt, mail):
+    # SQL: time each statement between SQLAlchemy's cursor events
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record('sql', time.perf_counter() - conn.info['query_start'].pop())
+
+    # bcrypt and mail are called straight from the views, so time them at the extension
+    if not hasattr(bcrypt.check_password_hash, '__wrapped__'):
+        bcrypt.generate_password_hash = timed_call('bcrypt', bcrypt.generate_password_hash)
+        bcrypt.check_password_hash = timed_call('bcrypt', bcrypt.check_password_hash)
+        mail.send = timed_call('mail', mail.send)
+
+    # Rendering can nest (includes), so keep a stack of start times per request
+    def render_started(sender, template, context, **extra):
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.renders.append(time.perf_counter())
+
+    def render_finished(sender, template, context, **extra):
+        recorder = _current.get()
+        if recorder is not None and recorder.renders:
+            recorder.add('render', time.perf_counter() - recorder.renders.pop())
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.before_request
+    def start_recording():
+        request.environ['instrumentation.token'] = _current.set(Recorder())
+
+    @app.after_request
+    def report(response):
+        recorder = _current.get()
+        if recorder is None:
+            return response
+        timings = [
+            f'{phase};dur={recorder.seconds[phase] * 1000:.2f};desc="{recorder.counts[phase]} calls"'
+            for phase in sorted(recorder.seconds)
+        ]
+        timings.append(f'total;dur={(time.perf_counter() - recorder.start) * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    @app.teardown_request
+    def stop_recording(exc):
+        token = request.environ.pop('instrumentation.token', None)
+        if token is not None:
+            _current.reset(token)
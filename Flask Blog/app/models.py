@@ -1,13 +1,19 @@
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 from flask_login import UserMixin
+from sqlalchemy import event
 import jwt
 from app import db
+from app.search import plain_text
+
+# Words of plain text kept as a post's teaser
+EXCERPT_WORDS = 50
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    image_file = db.Column(db.String(20), nullable=False, default='default.jpg')
+    image_file = db.Column(db.String(20), nullable=False, default='default.jpg', index=True)
     password = db.Column(db.String(60), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     posts = db.relationship('Post', backref='author', lazy=True)
@@ -35,4 +41,23 @@ class Post(db.Model):
     title = db.Column(db.String(100), nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.now(timezone.utc))
     content = db.Column(db.Text, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
\ No newline at end of file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Derived from content whenever it is set, so listings never load or split the body
+    excerpt = db.Column(db.Text, nullable=False, default='')
+    word_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Listings page through posts newest first, overall and per author
+    __table_args__ = (
+        db.Index('ix_post_date_posted_id', 'date_posted', 'id'),
+        db.Index('ix_post_user_id_date_posted_id', 'user_id', 'date_posted', 'id'),
+    )
+
+@lru_cache(maxsize=8)
+def summarize(content):
+    """(excerpt, word count) of post HTML; cached so validating and saving a post split it once."""
+    words = plain_text(content).split()
+    return ' '.join(words[:EXCERPT_WORDS]), len(words)
+
+@event.listens_for(Post.content, 'set')
+def update_summary(post, content, oldvalue, initiator):
+    post.excerpt, post.word_count = summarize(content or '')
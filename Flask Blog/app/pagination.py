@@ -0,0 +1,125 @@
+"""
+Keyset (cursor) pagination for the listing pages.
+
+Instead of OFFSET, a page continues from the sort key of the row it starts
+after (or before), e.g. ?after=2024-05-01T12:00:00.000000_42, so every page
+is one index range scan however deep it is. Page numbers are carried along
+in the links for display only, and the total shown beside them is a count
+cached for PAGINATION_COUNT_TTL seconds.
+"""
+import math
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import DateTime, tuple_
+
+# Seconds an approximate total is reused before it is counted again
+COUNT_TTL = 60
+
+
+class CountCache:
+    """Row counts per listing, recounted at most once every ttl seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, count):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+        if cached is not None and now - cached[1] < self.ttl:
+            return cached[0]
+        total = count()
+        with self._lock:
+            self._counts[key] = (total, now)
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class KeysetPage:
+    """One page of a listing ordered by keys, newest first, with cursors to its neighbours."""
+
+    def __init__(self, items, keys, page, per_page, has_prev, has_next, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.total = total
+        self.prev_cursor = encode(keys, items[0]) if items and has_prev else None
+        self.next_cursor = encode(keys, items[-1]) if items and has_next else None
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(math.ceil(self.total / self.per_page), 1)
+
+
+def encode(keys, item):
+    """Cursor for item: its sort key values joined by underscores."""
+    values = []
+    for key in keys:
+        value = getattr(item, key.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else str(value))
+    return '_'.join(values)
+
+
+def decode(keys, cursor):
+    """Sort key values from a cursor, or None if it is malformed."""
+    parts = cursor.split('_')
+    if len(parts) != len(keys):
+        return None
+    try:
+        return [
+            datetime.fromisoformat(part) if isinstance(key.type, DateTime) else key.type.python_type(part)
+            for key, part in zip(keys, parts)
+        ]
+    except (ValueError, NotImplementedError):
+        return None
+
+
+def paginate(query, keys, per_page, count_key=None):
+    """
+    Return the KeysetPage of query named by the request's after/before
+    cursor, ordered by keys descending. With count_key, the page also
+    carries the cached total of query.
+    """
+    after = decode(keys, request.args['after']) if 'after' in request.args else None
+    before = decode(keys, request.args['before']) if 'before' in request.args else None
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    total = None
+    if count_key is not None:
+        total = current_app.extensions['pagination_counts'].get(count_key, query.order_by(None).count)
+
+    if before is not None:
+        # Walk back towards the newest rows, then restore the page's order
+        rows = query.filter(tuple_(*keys) > tuple_(*before)) \
+            .order_by(*[key.asc() for key in keys]).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        return KeysetPage(items, keys, page if has_prev else 1, per_page, has_prev, True, total)
+
+    if after is not None:
+        query = query.filter(tuple_(*keys) < tuple_(*after))
+    else:
+        page = 1
+    rows = query.order_by(*[key.desc() for key in keys]).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], keys, page, per_page, after is not None, len(rows) > per_page, total)
+
+
+def init_app(app, db):
+    """Set up the count cache and create indexes missing from databases made before they were declared."""
+    app.extensions['pagination_counts'] = CountCache(app.config.get('PAGINATION_COUNT_TTL', COUNT_TTL))
+    with app.app_context():
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
@@ -1,15 +1,21 @@
-from flask import Blueprint, render_template, url_for, flash, redirect, request, abort, current_app
+import os
+from flask import (
+    Blueprint, render_template, url_for, flash, redirect, request, abort, current_app, send_from_directory
+)
 from flask_login import login_user, logout_user, current_user, login_required
 from flask_mail import Message
 from app import db, bcrypt, mail
+from app import search as post_search
+from app import avatars
+from app.pagination import paginate
+from app.cache import cached_page, depends
+from app.users import current_record
 from app.models import User, Post
+from sqlalchemy.orm import joinedload, load_only
 from app.forms import (
     RegistrationForm, LoginForm, UpdateAccountForm,
     PostForm, RequestResetForm, ResetPasswordForm, SearchForm
 )
-import os
-import secrets
-from PIL import Image
 from datetime import datetime
 
 # Create blueprints
@@ -22,10 +28,14 @@ auth = Blueprint('auth', __name__)
 
 @main.route("/")
 @main.route("/home")
+@cached_page
 def home():
     try:
-        page = request.args.get('page', 1, type=int)
-        posts = Post.query.order_by(Post.date_posted.desc()).paginate(page=page, per_page=5)
+        depends('posts')
+        posts = paginate(Post.query.options(
+            load_only(Post.title, Post.date_posted, Post.excerpt, Post.word_count),
+            joinedload(Post.author).load_only(User.username, User.image_file)
+        ), (Post.date_posted, Post.id), per_page=5, count_key='home')
         return render_template("home.html", posts=posts)
     except Exception as e:
         error_message = f'An error occurred in home route: {str(e)}'
@@ -48,7 +58,8 @@ def about():
 def admin_users():
     try:
         if current_user.has_admin_privileges():
-            users = User.query.all()
+            users = paginate(User.query.options(load_only(User.username, User.email, User.is_admin)),
+                             (User.id,), per_page=50, count_key='admin_users')
             return render_template('admin_users.html', users=users)
         else:
             abort(403)
@@ -62,7 +73,7 @@ def admin_users():
 @login_required
 def admin_delete_post(post_id):
     try:
-        if current_user.has_admin_privileges():
+        if current_record().has_admin_privileges():
             post = Post.query.get_or_404(post_id)
             db.session.delete(post)
             db.session.commit()
@@ -80,7 +91,7 @@ def admin_delete_post(post_id):
 @login_required
 def admin_delete_user(user_id):
     try:
-        if current_user.has_admin_privileges():
+        if current_record().has_admin_privileges():
             user = User.query.get_or_404(user_id)
             db.session.delete(user)
             db.session.commit()
@@ -99,7 +110,11 @@ def admin_delete_user(user_id):
 def admin_posts():
     try:
         if current_user.has_admin_privileges():
-            posts = Post.query.all()
+            # The table shows no content; the author comes in the same query for its name and admin flag
+            posts = paginate(Post.query.options(
+                load_only(Post.title, Post.date_posted),
+                joinedload(Post.author).load_only(User.username, User.is_admin)
+            ), (Post.date_posted, Post.id), per_page=50, count_key='admin_posts')
             return render_template('admin_posts.html', title='Admin Posts', posts=posts)
         else:
             abort(403)
@@ -124,11 +139,11 @@ def admin_dashboard():
         return redirect(url_for('main.home'))
 
 @main.route("/post/<int:post_id>")
+@cached_page
 def post(post_id):
     try:
-        post = Post.query.get_or_404(post_id)
-        image_url = url_for('static', filename='profile_pics/' + post.author.image_file)
-        return render_template('post.html', title=post.title, post=post, image=image_url)
+        post = Post.query.options(joinedload(Post.author)).get_or_404(post_id)
+        return render_template('post.html', title=post.title, post=post)
     except Exception as e:
         error_message = f'An error occurred in post route: {str(e)}'
         current_app.logger.error(error_message, exc_info=True)
@@ -140,7 +155,7 @@ def post(post_id):
 def update_post(post_id):
     try:
         post = Post.query.get_or_404(post_id)
-        if post.author != current_user:
+        if post.user_id != current_user.id:
             abort(403)
 
         form = PostForm(obj=post)
@@ -162,7 +177,7 @@ def update_post(post_id):
 def delete_post(post_id):
     try:
         post = Post.query.get_or_404(post_id)
-        if post.author != current_user:
+        if post.user_id != current_user.id:
             abort(403)
         db.session.delete(post)
         db.session.commit()
@@ -175,13 +190,15 @@ def delete_post(post_id):
         return redirect(url_for('main.home'))
 
 @main.route("/user/<string:username>")
+@cached_page
 def user_posts(username):
     try:
-        page = request.args.get('page', 1, type=int)
         user = User.query.filter_by(username=username).first_or_404()
-        posts = Post.query.filter_by(author=user)\
-            .order_by(Post.date_posted.desc())\
-            .paginate(page=page, per_page=5)
+        depends(f'posts-by:{user.id}')
+        # Every post is by user, so the template reads the author from user instead of each post
+        posts = paginate(Post.query.filter_by(user_id=user.id)
+                         .options(load_only(Post.title, Post.date_posted, Post.excerpt, Post.word_count)),
+                         (Post.date_posted, Post.id), per_page=5, count_key=('user', user.id))
         return render_template('user_posts.html', posts=posts, user=user)
     except Exception as e:
         error_message = f'An error occurred in user_posts route: {str(e)}'
@@ -189,43 +206,41 @@ def user_posts(username):
         flash('Internal Server Error', 'danger')
         return redirect(url_for('main.home'))
 
+@main.route("/avatars/<string:name>")
+def avatar(name):
+    # Content-addressed names never change content, so browsers and proxies may keep them for good
+    directory = os.path.join(current_app.root_path, 'static', 'profile_pics')
+    if name in avatars.PROTECTED:
+        response = send_from_directory(directory, name)
+        response.cache_control.no_cache = True
+        return response
+    response = send_from_directory(directory, name, etag=os.path.splitext(name)[0], max_age=avatars.MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @main.route("/search", methods=['GET', 'POST'])
 def search():
     form = SearchForm()
 
+    # The form posts the term; results live at a GET URL so they can be paged
     if form.validate_on_submit():
-        search_term = form.search.data
-        search_results = perform_search(search_term)
-
-        if not search_results:
-            flash(f'No results found for "{search_term}"', 'info')
-        return render_template('search.html', title='Search Results', form=form, search_results=search_results)
-
-    return render_template('search.html', title='Search', form=form)
+        return redirect(url_for('main.search', q=form.search.data))
 
-def perform_search(search_term):
-    matching_posts = Post.query.filter(
-        (Post.title.ilike(f"%{search_term}%")) | (Post.content.ilike(f"%{search_term}%"))
-    ).all()
+    search_term = request.args.get('q', '').strip()
+    if not search_term:
+        return render_template('search.html', title='Search', form=form)
 
-    search_results = []
+    form.search.data = search_term
+    page = max(request.args.get('page', 1, type=int), 1)
+    search_results, total = perform_search(search_term, page)
+    if not total:
+        flash(f'No results found for "{search_term}"', 'info')
+    return render_template('search.html', title='Search Results', form=form, search_results=search_results,
+                           search_term=search_term, page=page, pages=-(-total // post_search.PER_PAGE), total=total)
 
-    for post in matching_posts:
-        title_occurrences = post.title.lower().count(search_term.lower())
-        content_occurrences = post.content.lower().count(search_term.lower())
-        admin = post.author.username
-        post_date = post.date_posted.strftime('%Y-%m-%d %H:%M:%S')
-
-        search_results.append({
-            'post_title': post.title,
-            'title_occurrences': title_occurrences,
-            'content_occurrences': content_occurrences,
-            'admin': admin,
-            'post_date': post_date,
-            'id': post.id
-        })
-
-    return search_results
+def perform_search(search_term, page=1):
+    return post_search.search(db, search_term, page)
 
 # ----------------------
 # Auth Blueprint Routes
@@ -287,25 +302,26 @@ def logout():
 @login_required
 def account():
     try:
+        user = current_record()
         form = UpdateAccountForm()
 
         if form.validate_on_submit():
-            if form.picture.data:
-                picture_file = save_picture(form.picture.data)
-                current_user.image_file = picture_file
-
-            current_user.username = form.username.data
-            current_user.email = form.email.data
+            user.username = form.username.data
+            user.email = form.email.data
             db.session.commit()
             flash('Account Updated', 'success')
+
+            # The picture switches over once it has been processed; until then the current one stays
+            if form.picture.data:
+                save_picture(form.picture.data)
+                flash('Your new picture will appear in a moment', 'info')
             return redirect(url_for('auth.account'))
 
         elif request.method == 'GET':
-            form.username.data = current_user.username
-            form.email.data = current_user.email
+            form.username.data = user.username
+            form.email.data = user.email
 
-        image_file = url_for('static', filename='profile_pics/' + current_user.image_file)
-        return render_template("account.html", title='Account', image_file=image_file, form=form)
+        return render_template("account.html", title='Account', form=form, user=user)
     except Exception as e:
         error_message = f'An error occurred in account route: {str(e)}'
         current_app.logger.error(error_message, exc_info=True)
@@ -318,7 +334,7 @@ def new_post():
     try:
         form = PostForm()
         if form.validate_on_submit():
-            post = Post(title=form.title.data, content=form.content.data, author=current_user)
+            post = Post(title=form.title.data, content=form.content.data, author=current_record())
             db.session.add(post)
             db.session.commit()
             flash('Your post has been created!', 'success')
@@ -374,17 +390,7 @@ def reset_token(token):
 # Helper functions
 def save_picture(form_picture):
     try:
-        random_hex = secrets.token_hex(8)
-        _, f_ext = os.path.splitext(form_picture.filename)
-        picture_fn = random_hex + f_ext
-        picture_path = os.path.join(current_app.root_path, 'static/profile_pics', picture_fn)
-
-        output_size = (125, 125)
-        i = Image.open(form_picture)
-        i.thumbnail(output_size)
-        i.save(picture_path)
-
-        return picture_fn
+        return current_app.extensions['images'].submit(current_user.id, form_picture)
     except Exception as e:
         error_message = f'An error occurred in save_picture helper: {str(e)}'
         current_app.logger.error(error_message, exc_info=True)
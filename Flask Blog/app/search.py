@@ -0,0 +1,157 @@
+"""
+Full-text search over posts with SQLite FTS5.
+
+post_fts holds the title and the tag-stripped text of each post under the
+post's id as rowid. SQLAlchemy mapper events keep it in step with every
+insert, update and delete of a Post. Queries are ranked by BM25, with
+title matches weighted above body matches, and return highlighted
+snippets. `flask rebuild-search` repopulates the index from the post table.
+"""
+import html
+import re
+
+import click
+from markupsafe import Markup, escape
+from sqlalchemy import DateTime, event, text
+
+# Results per search page
+PER_PAGE = 10
+
+# BM25 weight of a title match relative to a body match
+TITLE_WEIGHT = 10.0
+
+# Tokens of context shown around the matches in a snippet
+SNIPPET_TOKENS = 24
+
+SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, body, tokenize = 'porter unicode61')"
+
+# Control characters never present in text, used to mark highlights before escaping
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_TAGS = re.compile(r'<[^>]*>')
+_WORDS = re.compile(r'\w+', re.UNICODE)
+
+
+def plain_text(content):
+    """Post HTML as plain text for indexing."""
+    return ' '.join(html.unescape(_TAGS.sub(' ', content or '')).split())
+
+
+def to_match(term):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = _WORDS.findall(term)
+    if not words:
+        return None
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _highlighted(value):
+    return Markup(str(escape(value)).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+def _index(connection, post):
+    connection.execute(
+        text('INSERT INTO post_fts (rowid, title, body) VALUES (:id, :title, :body)'),
+        {'id': post.id, 'title': post.title, 'body': plain_text(post.content)},
+    )
+
+
+def _unindex(connection, post_id):
+    connection.execute(text('DELETE FROM post_fts WHERE rowid = :id'), {'id': post_id})
+
+
+def search(db, term, page=1, per_page=PER_PAGE):
+    """
+    Return (results, total) for one page of posts matching term, best first.
+
+    Each result has id, title (highlighted Markup), snippet (highlighted
+    Markup), author, date_posted and rank.
+    """
+    query = to_match(term)
+    if query is None:
+        return [], 0
+    total = db.session.execute(
+        text('SELECT count(*) FROM post_fts WHERE post_fts MATCH :query'), {'query': query}
+    ).scalar()
+    rows = db.session.execute(
+        text(
+            'SELECT post.id, post.date_posted, user.username, '
+            'highlight(post_fts, 0, :open, :close) AS title, '
+            'snippet(post_fts, 1, :open, :close, :ellipsis, :tokens) AS snippet, '
+            'bm25(post_fts, :title_weight, 1.0) AS rank '
+            'FROM post_fts JOIN post ON post.id = post_fts.rowid JOIN user ON user.id = post.user_id '
+            'WHERE post_fts MATCH :query ORDER BY rank LIMIT :limit OFFSET :offset'
+        ).columns(date_posted=DateTime),
+        {
+            'query': query,
+            'open': _OPEN,
+            'close': _CLOSE,
+            'ellipsis': '…',
+            'tokens': SNIPPET_TOKENS,
+            'title_weight': TITLE_WEIGHT,
+            'limit': per_page,
+            'offset': (page - 1) * per_page,
+        },
+    )
+    results = [
+        {
+            'id': row.id,
+            'title': _highlighted(row.title),
+            'snippet': _highlighted(row.snippet),
+            'author': row.username,
+            'date_posted': row.date_posted,
+            'rank': row.rank,
+        }
+        for row in rows
+    ]
+    return results, total
+
+
+def rebuild(db):
+    """Repopulate post_fts from the post table; returns the number of posts indexed."""
+    connection = db.session.connection()
+    connection.execute(text('DELETE FROM post_fts'))
+    result = connection.execute(text('SELECT id, title, content FROM post'))
+    count = 0
+    while rows := result.fetchmany(1000):
+        connection.execute(
+            text('INSERT INTO post_fts (rowid, title, body) VALUES (:id, :title, :body)'),
+            [{'id': row.id, 'title': row.title, 'body': plain_text(row.content)} for row in rows],
+        )
+        count += len(rows)
+    connection.execute(text("INSERT INTO post_fts (post_fts) VALUES ('optimize')"))
+    db.session.commit()
+    return count
+
+
+def init_app(app, db):
+    """Create the index (filling it on first creation), hook Post events and add `flask rebuild-search`."""
+    from app.models import Post
+
+    with app.app_context():
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'")
+        ).first()
+        if not exists:
+            db.session.execute(text(SCHEMA))
+            db.session.commit()
+            rebuild(db)
+
+    if not getattr(Post, '_search_indexed', False):
+        # Models are module-level, so hook them once even if create_app runs again
+        Post._search_indexed = True
+        event.listen(Post, 'after_insert', lambda mapper, connection, post: _index(connection, post))
+
+        @event.listens_for(Post, 'after_update')
+        def reindex(mapper, connection, post):
+            _unindex(connection, post.id)
+            _index(connection, post)
+
+        event.listen(Post, 'after_delete', lambda mapper, connection, post: _unindex(connection, post.id))
+
+    @app.cli.command('rebuild-search')
+    def rebuild_search():
+        """Rebuild the full-text search index from the post table."""
+        click.echo(f'Indexed {rebuild(db)} posts')
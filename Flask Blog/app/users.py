@@ -0,0 +1,151 @@
+"""
+Flask-Login user loader backed by a per-process cache of user snapshots.
+
+current_user is a frozen UserSnapshot holding only what pages read (id,
+username, image_file, is_admin), loaded with a single column query and
+reused for USER_CACHE_TTL seconds. At most USER_CACHE_SIZE snapshots are
+kept, least recently used evicted first. An authenticated page view
+therefore costs no User lookup at all while its snapshot is cached.
+
+A snapshot is dropped once a transaction that updated or deleted its user
+commits, so /account changes and admin deletes show up on the next request
+in this process. Other worker processes catch up within USER_CACHE_TTL.
+Routes that change data act on the real row from current_record() rather
+than on the snapshot.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from flask import abort, current_app, has_app_context
+from flask_login import UserMixin, current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+# Seconds a snapshot is served before the user is read again
+USER_CACHE_TTL = 30
+
+# Snapshots kept per process
+USER_CACHE_SIZE = 1000
+
+
+@dataclass(frozen=True, eq=False)
+class UserSnapshot(UserMixin):
+    """Read-only copy of a User for current_user; compares equal to the User with the same id."""
+    id: int
+    username: str
+    image_file: str
+    is_admin: bool
+
+    def has_admin_privileges(self):
+        return self.is_admin
+
+
+class SnapshotCache:
+    """Snapshots by user id, each reused for at most ttl seconds, least recently used evicted past maxsize."""
+
+    def __init__(self, ttl, maxsize=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, load):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._snapshots.get(user_id)
+            if cached is not None and now - cached[1] < self.ttl:
+                self._snapshots.move_to_end(user_id)
+                return cached[0]
+        snapshot = load()
+        with self._lock:
+            if snapshot is None:
+                self._snapshots.pop(user_id, None)
+            else:
+                self._snapshots[user_id] = (snapshot, now)
+                self._snapshots.move_to_end(user_id)
+                while len(self._snapshots) > self.maxsize:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    def forget(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._snapshots.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+
+def load_user(user_id):
+    """Flask-Login user_loader: the cached snapshot of user_id, or None if there is no such user."""
+    from app import db
+    from app.models import User
+
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    def load():
+        row = db.session.execute(
+            select(User.id, User.username, User.image_file, User.is_admin).where(User.id == user_id)
+        ).first()
+        return UserSnapshot(row.id, row.username, row.image_file, bool(row.is_admin)) if row else None
+
+    return current_app.extensions['user_snapshots'].get(user_id, load)
+
+
+def current_record():
+    """The signed-in User row, for routes that change it or act with its privileges."""
+    from app import db
+    from app.models import User
+
+    user = db.session.get(User, current_user.id)
+    if user is None:
+        # Deleted by an admin while this process still held a snapshot
+        abort(401)
+    return user
+
+
+def _forget_later(session, user):
+    if session is not None:
+        session.info.setdefault('changed_users', set()).add(user.id)
+
+
+def _after_commit(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids and has_app_context() and 'user_snapshots' in current_app.extensions:
+        current_app.extensions['user_snapshots'].forget(user_ids)
+
+
+def _after_rollback(session):
+    session.info.pop('changed_users', None)
+
+
+def init_app(app, login_manager):
+    """Register the loader and its cache, and hook User updates and deletes once."""
+    from app.models import User
+
+    app.extensions['user_snapshots'] = SnapshotCache(
+        app.config.get('USER_CACHE_TTL', USER_CACHE_TTL), app.config.get('USER_CACHE_SIZE', USER_CACHE_SIZE)
+    )
+    login_manager.user_loader(load_user)
+
+    if getattr(User, '_snapshots_tracked', False):
+        return
+    # Models are module-level, so hook them once even if create_app runs again
+    User._snapshots_tracked = True
+
+    @event.listens_for(User, 'after_update')
+    def user_updated(mapper, connection, user):
+        _forget_later(object_session(user), user)
+
+    @event.listens_for(User, 'after_delete')
+    def user_deleted(mapper, connection, user):
+        _forget_later(object_session(user), user)
+
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,88 @@
+"""
+Throughput of profile picture processing on batches of large photos.
+
+Processes --batch copies of the multi-megabyte JPEGs in static/profile_pics
+the old way (decode and thumbnail to 125px inside the request) and through
+app.images.process, with and without draft-mode decoding, on 1 to
+--workers worker processes. Also times what the request itself now does:
+writing the upload to the staging directory.
+"""
+import argparse
+import multiprocessing
+import os
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+from PIL import Image
+
+from app.images import process
+
+PICTURES = os.path.join(HERE, 'app', 'static', 'profile_pics')
+
+
+def legacy(source, directory):
+    # save_picture() as it was, minus the Flask plumbing
+    image = Image.open(source)
+    image.thumbnail((125, 125))
+    image.save(os.path.join(directory, secrets.token_hex(8) + '.jpg'))
+
+
+def run(function, sources, directory, workers, **options):
+    """Seconds to push every source through function on a pool of workers."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        # Start the workers before timing, as a running app's pool already would be
+        list(pool.map(time.sleep, [0] * workers))
+        start = time.perf_counter()
+        futures = [pool.submit(function, source, directory, **options) for source in sources]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--batch', type=int, default=48, help='pictures per run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    large = sorted(name for name in os.listdir(PICTURES)
+                   if os.path.getsize(os.path.join(PICTURES, name)) > 1_000_000)
+    sources = [os.path.join(PICTURES, large[i % len(large)]) for i in range(args.batch)]
+    megapixels = sum(Image.open(source).width * Image.open(source).height for source in sources) / 1e6
+    print(f'{args.batch} pictures from {", ".join(large)}, {megapixels / args.batch:.1f} MP on average')
+
+    scratch = tempfile.mkdtemp()
+    try:
+        # What /account does now before returning: copy the upload to the staging directory
+        start = time.perf_counter()
+        for i, source in enumerate(sources):
+            shutil.copyfile(source, os.path.join(scratch, f'staged{i}.jpg'))
+        staged_ms = (time.perf_counter() - start) / len(sources) * 1000
+        print(f'request side, staging the upload: {staged_ms:.2f} ms per picture')
+
+        worker_counts = sorted({1, 2, args.workers // 2 or 1, args.workers})
+        runs = [('old save_picture, 125px only', legacy, {}),
+                ('pipeline, no draft decode', process, {'draft': False}),
+                ('pipeline, draft decode', process, {})]
+        print(f'{"":<32}' + ''.join(f'{f"{workers} worker" + ("s" if workers > 1 else ""):>14}' for workers in worker_counts))
+        for label, function, options in runs:
+            rates = []
+            for workers in worker_counts:
+                elapsed = run(function, sources, scratch, workers, **options)
+                rates.append(len(sources) / elapsed)
+            print(f'{label:<32}' + ''.join(f'{rate:10.1f}/s   ' for rate in rates))
+        print('(pictures per second; the pipeline writes 3 sizes x JPEG + WebP per picture)')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
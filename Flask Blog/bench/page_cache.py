@@ -0,0 +1,94 @@
+"""
+Time anonymous page views with and without the page cache.
+
+Generates a blog in a scratch database and requests home, a post and an
+author's page as an anonymous visitor with PAGE_CACHE off, 'memory' and
+'disk'. Each page is timed as a cache hit, as a 304 revalidation and as a
+miss, the first view after a post is edited.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Same synthetic blog as the pagination benchmark
+from pagination import generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    os.chdir(scratch)
+    path = os.path.join(scratch, 'bench.db')
+    generate(path, args.posts, args.authors)
+
+    from flask import g
+
+    from app import create_app, db
+    from app.models import Post
+
+    # Each page, and a post on it whose edit must invalidate it
+    connection = sqlite3.connect(path)
+    newest = connection.execute('SELECT max(id) FROM post').fetchone()[0]
+    by_author1 = connection.execute('SELECT max(id) FROM post WHERE user_id = 1').fetchone()[0]
+    connection.close()
+    pages = {'/home': newest, f'/post/{newest}': newest, '/user/author1': by_author1}
+
+    print(f'{"":>8} {"page":<14} {"uncached":>9} {"hit":>9} {"304":>9} {"miss":>9}   ms, median of {args.repeat}')
+    for backend in ('', 'memory', 'disk'):
+        class BenchConfig:
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+            PAGE_CACHE = backend
+            PAGE_CACHE_PATH = os.path.join(scratch, f'cache-{backend}.db')
+
+        app = create_app(BenchConfig)
+
+        def view(url, headers=None):
+            with app.test_request_context(url, headers=headers):
+                # No user_loader round trip: the visitor is anonymous
+                g._login_user = app.login_manager.anonymous_user()
+                return app.full_dispatch_request()
+
+        def timed(fn):
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fn()
+                samples.append((time.perf_counter() - start) * 1000)
+            return statistics.median(samples)
+
+        def edit(post_id):
+            with app.app_context():
+                post = db.session.get(Post, post_id)
+                post.title = f'Edited {time.perf_counter()}'
+                db.session.commit()
+
+        for url, post_id in pages.items():
+            etag = view(url).headers.get('ETag')
+            hit = timed(lambda: view(url))
+            revalidate = timed(lambda: view(url, {'If-None-Match': etag})) if etag else None
+            misses = []
+            for _ in range(max(args.repeat // 10, 1)):
+                edit(post_id)
+                start = time.perf_counter()
+                view(url)
+                misses.append((time.perf_counter() - start) * 1000)
+            label = backend or 'off'
+            if not backend:
+                print(f'{label:>8} {url:<14} {hit:9.3f}')
+            else:
+                print(f'{label:>8} {url:<14} {"":>9} {hit:9.3f} {revalidate:9.3f} {statistics.median(misses):9.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Compare OFFSET pagination with keyset pagination on a large blog.
+
+Generates --posts posts spread over --authors authors in a scratch database,
+lets create_app add the listing indexes, then times page 1 and a deep page
+of home and of the busiest author's page. Each is fetched with the old
+COUNT plus OFFSET statements before the indexes exist, with Flask-SQLAlchemy's
+paginate() once they do, and with app.pagination (cursor plus cached count),
+and finally through the home route itself.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PER_PAGE = 5
+
+
+def generate(path, posts, authors, seed=0):
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(20) NOT NULL UNIQUE,
+            email VARCHAR(120) NOT NULL UNIQUE, image_file VARCHAR(20) NOT NULL,
+            password VARCHAR(60) NOT NULL, is_admin BOOLEAN);
+        CREATE TABLE post (id INTEGER PRIMARY KEY, title VARCHAR(100) NOT NULL,
+            date_posted DATETIME NOT NULL, content TEXT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES user (id), excerpt TEXT NOT NULL DEFAULT '',
+            word_count INTEGER NOT NULL DEFAULT 0);
+    ''')
+    connection.executemany(
+        'INSERT INTO user (id, username, email, image_file, password, is_admin) VALUES (?, ?, ?, ?, ?, 0)',
+        [(i, f'author{i}', f'author{i}@example.com', 'default.jpg', 'x') for i in range(1, authors + 1)],
+    )
+    start = datetime(2020, 1, 1)
+
+    def rows():
+        for i in range(1, posts + 1):
+            # Author 1 writes a tenth of everything, so their page goes deep too
+            user_id = 1 if rng.random() < 0.1 else rng.randint(2, authors)
+            # Stored the way SQLAlchemy writes DateTime to SQLite
+            date = (start + timedelta(seconds=i * 30 + rng.randint(0, 29))).strftime('%Y-%m-%d %H:%M:%S.%f')
+            yield i, f'Post {i}', date, '<p>lorem ipsum</p>', user_id, 'lorem ipsum', 2
+
+    connection.executemany(
+        'INSERT INTO post (id, title, date_posted, content, user_id, excerpt, word_count) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        rows(),
+    )
+    connection.commit()
+    connection.close()
+
+
+def timed(fn, repeat):
+    """Median milliseconds of repeat calls."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def legacy_unindexed(path, page, user_id, repeat):
+    """The old home/user page statements on the table as it was, without the listing indexes."""
+    connection = sqlite3.connect(path)
+    where, params = ('WHERE post.user_id = ?', (user_id,)) if user_id else ('', ())
+
+    def run():
+        connection.execute(f'SELECT count(*) FROM post {where}', params).fetchone()
+        connection.execute(
+            'SELECT post.id, post.title, post.date_posted, post.excerpt, post.word_count, user.username, '
+            f'user.image_file FROM post LEFT OUTER JOIN user ON user.id = post.user_id {where} '
+            'ORDER BY post.date_posted DESC LIMIT ? OFFSET ?', params + (PER_PAGE, (page - 1) * PER_PAGE)
+        ).fetchall()
+
+    ms = timed(run, repeat)
+    connection.close()
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=1_000_000)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--page', type=int, default=10_000, help='deep page to compare with page 1')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    os.chdir(scratch)
+    path = os.path.join(scratch, 'bench.db')
+    start = time.perf_counter()
+    generate(path, args.posts, args.authors)
+    print(f'generated {args.posts:,} posts in {time.perf_counter() - start:.1f}s')
+
+    unindexed = {
+        (label, page): legacy_unindexed(path, page, user_id, args.repeat)
+        for label, user_id in (('home', None), ('author1', 1))
+        for page in (1, args.page)
+    }
+
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        # Every request must reach the database being measured
+        PAGE_CACHE = ''
+
+    from flask import g
+    from sqlalchemy.orm import joinedload, load_only
+
+    from app import create_app, db, pagination
+    from app.models import Post, User
+
+    start = time.perf_counter()
+    app = create_app(BenchConfig)
+    print(f'created indexes in {time.perf_counter() - start:.1f}s')
+
+    keys = (Post.date_posted, Post.id)
+
+    def listing(user_id=None):
+        query = Post.query.options(
+            load_only(Post.title, Post.date_posted, Post.excerpt, Post.word_count),
+            joinedload(Post.author).load_only(User.username, User.image_file),
+        )
+        return query if user_id is None else query.filter_by(user_id=user_id)
+
+    cursors = {}
+    with app.app_context():
+        for label, user_id in (('home', None), ('author1', 1)):
+            # Cursor of the last post on the page before the deep one
+            anchor = listing(user_id).order_by(Post.date_posted.desc(), Post.id.desc()) \
+                .offset((args.page - 1) * PER_PAGE - 1).first()
+            after = cursors[label] = pagination.encode(keys, anchor)
+
+            for page, url in ((1, '/home'), (args.page, f'/home?after={after}&page={args.page}')):
+                offset_ms = timed(lambda: listing(user_id).order_by(Post.date_posted.desc())
+                                  .paginate(page=page, per_page=PER_PAGE), args.repeat)
+                with app.test_request_context(url):
+                    keyset_ms = timed(lambda: pagination.paginate(listing(user_id), keys, PER_PAGE, label),
+                                      args.repeat)
+                    page_items = [post.id for post in pagination.paginate(listing(user_id), keys, PER_PAGE).items]
+                offset_items = [post.id for post in listing(user_id).order_by(Post.date_posted.desc(), Post.id.desc())
+                                .paginate(page=page, per_page=PER_PAGE).items]
+                same = 'same posts' if page_items == offset_items else 'DIFFERENT posts'
+                print(f'{label:>8} page {page:>6}   OFFSET unindexed {unindexed[label, page]:8.2f} ms'
+                      f'   OFFSET {offset_ms:8.2f} ms   keyset {keyset_ms:7.2f} ms   ({same})')
+                db.session.expunge_all()
+
+    # The whole route, template included; the user is set directly since the request is anonymous
+    for page, url in ((1, '/home'), (args.page, f"/home?after={cursors['home']}&page={args.page}")):
+        def request_home():
+            with app.test_request_context(url):
+                g._login_user = app.login_manager.anonymous_user()
+                app.full_dispatch_request()
+        print(f'{"route":>8} page {page:>6}   /home {timed(request_home, args.repeat):8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Count the SQL statements each listing page issues as the blog grows.
+
+Builds scratch databases with an increasing number of posts, each by a
+different author, and requests home, a user's posts, the admin post list,
+the admin user list and a search page. A page that loads authors lazily
+issues one more query per post, so the counts must stay the same at every
+size and within the page's budget; the script exits non-zero otherwise.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Most statements a page may issue, whatever the number of posts
+BUDGETS = {
+    '/home': 2,  # count, page
+    '/user/author1': 3,  # user, count, page
+    '/admin/posts': 2,  # count, page
+    '/admin/users': 2,  # count, page
+    '/search?q=lorem': 2,  # count, page
+}
+
+
+def generate(path, posts):
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(20) NOT NULL UNIQUE,
+            email VARCHAR(120) NOT NULL UNIQUE, image_file VARCHAR(20) NOT NULL,
+            password VARCHAR(60) NOT NULL, is_admin BOOLEAN);
+        CREATE TABLE post (id INTEGER PRIMARY KEY, title VARCHAR(100) NOT NULL,
+            date_posted DATETIME NOT NULL, content TEXT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES user (id));
+    ''')
+    connection.executemany(
+        'INSERT INTO user (id, username, email, image_file, password, is_admin) VALUES (?, ?, ?, ?, ?, ?)',
+        [(i, f'author{i}', f'author{i}@example.com', 'default.jpg', 'x', i == 1) for i in range(1, posts + 1)],
+    )
+    now = datetime.now()
+    connection.executemany(
+        'INSERT INTO post (id, title, date_posted, content, user_id) VALUES (?, ?, ?, ?, ?)',
+        [(i, f'Post {i}', now - timedelta(minutes=i), '<p>lorem ipsum dolor</p>', i) for i in range(1, posts + 1)],
+    )
+    connection.commit()
+    connection.close()
+
+
+def count_queries(posts):
+    """{path: statements issued} for one scratch blog with posts posts by as many authors."""
+    from flask import g
+    from flask_login import login_user
+    from sqlalchemy import event
+
+    from app import create_app, db
+    from app.models import User
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    generate(path, posts)
+
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        # Every request must reach the database being measured
+        PAGE_CACHE = ''
+
+    app = create_app(BenchConfig)
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', listener)
+
+    counts = {}
+    try:
+        for url in BUDGETS:
+            with app.test_request_context(url):
+                # Set the user for this request directly, so no user_loader query is counted
+                if url.startswith('/admin'):
+                    login_user(db.session.get(User, 1))
+                else:
+                    g._login_user = app.login_manager.anonymous_user()
+                statements.clear()
+                response = app.full_dispatch_request()
+                if response.status_code != 200:
+                    raise SystemExit(f'{url} returned {response.status_code}')
+                counts[url] = len(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+        with app.app_context():
+            db.engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='5,50,500', help='comma-separated numbers of posts')
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {size: count_queries(size) for size in sizes}
+
+    failed = False
+    print(f'{"page":<18}' + ''.join(f'{size:>8}' for size in sizes) + '  budget')
+    for url, budget in BUDGETS.items():
+        counts = [results[size][url] for size in sizes]
+        ok = max(counts) <= budget and len(set(counts)) == 1
+        failed |= not ok
+        print(f'{url:<18}' + ''.join(f'{count:>8}' for count in counts) + f'  {budget:>6}  {"ok" if ok else "FAIL"}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
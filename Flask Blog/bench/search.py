@@ -0,0 +1,122 @@
+"""
+Compare the old ILIKE search with the FTS5 index on a synthetic blog.
+
+Generates --posts posts of random HTML paragraphs in a scratch database,
+builds the index the way create_app does on first start, then times both
+searches for common, rare and multi-word terms.
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def generate(path, posts, words_per_post, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+                  for _ in range(20000)]
+    # Zipf-like weights, so a few words are everywhere and most are rare
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(20) NOT NULL UNIQUE,
+            email VARCHAR(120) NOT NULL UNIQUE, image_file VARCHAR(20) NOT NULL,
+            password VARCHAR(60) NOT NULL, is_admin BOOLEAN);
+        CREATE TABLE post (id INTEGER PRIMARY KEY, title VARCHAR(100) NOT NULL,
+            date_posted DATETIME NOT NULL, content TEXT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES user (id), excerpt TEXT NOT NULL DEFAULT '',
+            word_count INTEGER NOT NULL DEFAULT 0);
+    ''')
+    connection.executemany(
+        'INSERT INTO user (id, username, email, image_file, password, is_admin) VALUES (?, ?, ?, ?, ?, 0)',
+        [(i, f'author{i}', f'author{i}@example.com', 'default.jpg', 'x') for i in range(1, 101)],
+    )
+    now = datetime.now()
+    rows = []
+    for i in range(1, posts + 1):
+        words = rng.choices(vocabulary, cum_weights=weights, k=words_per_post)
+        paragraphs = ''.join(f'<p>{" ".join(words[j:j + 40])}</p>' for j in range(0, len(words), 40))
+        title = ' '.join(rng.choices(vocabulary, cum_weights=weights, k=6)).capitalize()
+        rows.append((i, title, now, paragraphs, rng.randint(1, 100)))
+    connection.executemany('INSERT INTO post (id, title, date_posted, content, user_id) VALUES (?, ?, ?, ?, ?)', rows)
+    connection.commit()
+    connection.close()
+    return vocabulary
+
+
+def legacy_search(Post, search_term):
+    # perform_search() as it was before the index
+    matching_posts = Post.query.filter(
+        (Post.title.ilike(f"%{search_term}%")) | (Post.content.ilike(f"%{search_term}%"))
+    ).all()
+    search_results = []
+    for post in matching_posts:
+        search_results.append({
+            'post_title': post.title,
+            'title_occurrences': post.title.lower().count(search_term.lower()),
+            'content_occurrences': post.content.lower().count(search_term.lower()),
+            'admin': post.author.username,
+            'post_date': post.date_posted.strftime('%Y-%m-%d %H:%M:%S'),
+            'id': post.id,
+        })
+    return search_results
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--words', type=int, default=200, help='words per post')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    os.chdir(scratch)
+    path = os.path.join(scratch, 'bench.db')
+    start = time.perf_counter()
+    vocabulary = generate(path, args.posts, args.words)
+    print(f'generated {args.posts:,} posts in {time.perf_counter() - start:.1f}s')
+
+    class BenchConfig:
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        # Every request must reach the database being measured
+        PAGE_CACHE = ''
+
+    from app import create_app, db, search
+    from app.models import Post
+
+    start = time.perf_counter()
+    app = create_app(BenchConfig)
+    print(f'built the FTS5 index in {time.perf_counter() - start:.1f}s')
+
+    # ILIKE matches the two words as one phrase, FTS5 as two words anywhere in the post
+    terms = {
+        'common word': vocabulary[0],
+        'rare word': vocabulary[5000],
+        'two words': f'{vocabulary[3]} {vocabulary[40]}',
+    }
+    with app.app_context():
+        for label, term in terms.items():
+            legacy_ms, legacy = timed(lambda: legacy_search(Post, term), args.repeat)
+            db.session.expunge_all()
+            fts_ms, (results, total) = timed(lambda: search.search(db, term), args.repeat)
+            print(f'{label:>12} {term!r:24} ILIKE {legacy_ms:9.1f} ms ({len(legacy):6} rows)'
+                  f'   FTS5 page 1 {fts_ms:7.1f} ms ({total:6} matches)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from app import create_app
 
-app = create_app()
-
+# Only when run as a script: the image pool's spawned workers import this module too
 if __name__ == '__main__':
+    app = create_app()
     app.run(debug=True)
\ No newline at end of file
@@ -1,25 +1,80 @@
-import os
+import click
+import csv
 import datetime
-from cs50 import SQL
-from flask import Flask, flash, redirect, render_template, request, session
-from flask_session import Session
+import io
+import os
+from flask import Flask, Response, flash, jsonify, redirect, render_template, request, session
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from helpers import apology, login_required, lookup, usd
+import database
+import export
+import helpers
+import holdings
+import instrumentation
+import leaderboard
+import lots
+import migrations
+import pricestore
+import pricestream
+import sessions
+import trades
+import valuation
+from helpers import apology, cents, login_required, lookup, lookup_many, quote_listeners, timestamp, to_cents, usd
 
 # Configure application
 app = Flask(__name__)
 
+# Transactions shown per page of /history
+HISTORY_PAGE_SIZE = 50
+
 # Custom filter
 app.jinja_env.filters["usd"] = usd
+app.jinja_env.filters["cents"] = cents
+app.jinja_env.filters["timestamp"] = timestamp
 
-# Configure session to use filesystem (instead of signed cookies)
+# Configure server-side sessions (instead of signed cookies): "memory", "sqlite" or "redis"
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "sqlite")
+app.config["SESSION_LIFETIME"] = int(os.environ.get("SESSION_LIFETIME", 86400))
+app.config["SESSION_REDIS_HOST"] = os.environ.get("SESSION_REDIS_HOST", "127.0.0.1")
+app.config["SESSION_REDIS_PORT"] = int(os.environ.get("SESSION_REDIS_PORT", 6379))
+session_store = sessions.init_app(app)
+
+# Configure SQLite database
+migrations.migrate("finance.db")
+db = database.Database("finance.db")
+
+# Keep a local history of every quote fetched upstream
+price_store = pricestore.PriceStore()
+quote_listeners.append(lambda stock: price_store.record(stock["symbol"], to_cents(stock["price"])))
+
+# One poller for every watched symbol, shared by all open price streams
+price_hub = pricestream.PriceHub()
+
+# Users ranked by equity, revalued on every trade and every quote fetched upstream
+board = leaderboard.Leaderboard()
+board.load(db)
+quote_listeners.append(lambda stock: board.on_price(stock["symbol"], to_cents(stock["price"])))
+
+# Opt-in request timing (Server-Timing header and /metrics) and sampling profiler
+app.config["INSTRUMENTATION"] = bool(os.environ.get("INSTRUMENTATION"))
+app.config["PROFILE_INTERVAL"] = float(os.environ.get("PROFILE_INTERVAL", 0))
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", "profiles")
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+if app.config["INSTRUMENTATION"]:
+    instrumentation.init_app(app, db=db, http=helpers.http)
+
+# Rows shown per page of /leaderboard
+LEADERBOARD_PAGE_SIZE = 25
+
+# Most orders accepted in one /api/orders basket
+MAX_BASKET = 100
 
-# Configure CS50 Library to use SQLite database
-db = SQL("sqlite:///finance.db")
+
+@app.teardown_appcontext
+def release_connection(exception):
+    """Return this request's database connection to the pool"""
+    db.release()
 
 
 @app.after_request
@@ -35,15 +90,90 @@ def after_request(response):
 @login_required
 def index():
     """Show portfolio of stocks"""
-    user_id = session["user_id"]
-    transactions_db = db.execute(
-        "SELECT symbol,SUM(shares) AS shares,price FROM transactions WHERE user_id = ? GROUP BY symbol",
-        user_id,
+    portfolio = valuation.value_portfolio(db, session["user_id"])
+    positions = [p for p in portfolio["positions"] if p["shares"] > 0]
+    return render_template("index.html", portfolio=portfolio, database=positions)
+
+
+@app.route("/api/portfolio")
+@login_required
+def api_portfolio():
+    """Portfolio valuation and P&L as JSON (amounts in dollars)"""
+    portfolio = valuation.value_portfolio(db, session["user_id"])
+    dollars = lambda cents: round(cents / 100, 2)
+    return jsonify(
+        positions=[
+            {
+                "symbol": p["symbol"],
+                "shares": p["shares"],
+                "price": dollars(p["price"]),
+                "stale": p["stale"],
+                "average_cost": dollars(p["average_cost"]),
+                "market_value": dollars(p["market_value"]),
+                "unrealized": dollars(p["unrealized"]),
+                "realized": dollars(p["realized"]),
+            }
+            for p in portfolio["positions"]
+        ],
+        cash=dollars(portfolio["cash"]),
+        market_value=dollars(portfolio["market_value"]),
+        unrealized=dollars(portfolio["unrealized"]),
+        realized=dollars(portfolio["realized"]),
+        equity=dollars(portfolio["equity"]),
     )
 
-    cash_db = db.execute("SELECT cash FROM users WHERE id = ?", user_id)
-    cash = int(cash_db[0]["cash"])
-    return render_template("index.html", cash=cash, database=transactions_db)
+
+@app.route("/stream/prices")
+@login_required
+def stream_prices():
+    """Server-Sent Events stream of price updates for ?symbols= (default: the user's holdings)"""
+    symbols = [s.strip() for s in request.args.get("symbols", "").upper().split(",") if s.strip()]
+    if not symbols:
+        rows = db.execute("SELECT symbol FROM holdings WHERE user_id = ?", session["user_id"], tuples=True)
+        symbols = [row[0] for row in rows]
+    if not all(pricestore.SYMBOL.fullmatch(symbol) for symbol in symbols):
+        return apology("Invalid symbol")
+    if len(symbols) > pricestream.MAX_SYMBOLS_PER_STREAM:
+        return apology("Too many symbols")
+    try:
+        subscription = price_hub.subscribe(symbols)
+    except pricestream.HubFull as e:
+        return apology(str(e), 503)
+    response = Response(
+        price_hub.events(subscription),
+        mimetype="text/event-stream",
+        headers={"X-Accel-Buffering": "no"},
+    )
+    # The generator's own cleanup never runs if it is not iterated (HEAD, or a client gone before the first byte)
+    response.call_on_close(lambda: price_hub.unsubscribe(subscription))
+    return response
+
+
+@app.route("/api/gains")
+@login_required
+def api_gains():
+    """Realized gains per matched lot as JSON, optionally for one calendar year"""
+    year = request.args.get("year", type=int)
+    start = end = None
+    if year:
+        start = int(datetime.datetime(year, 1, 1).timestamp())
+        end = int(datetime.datetime(year + 1, 1, 1).timestamp())
+    rows = lots.realized_gains(db, session["user_id"], start, end)
+    return jsonify(
+        gains=[
+            {
+                "symbol": row["symbol"],
+                "acquired": row["acquired"],
+                "sold": row["date"],
+                "shares": row["shares"],
+                "cost": row["cost"] / 100,
+                "proceeds": row["proceeds"] / 100,
+                "gain": row["gain"] / 100,
+            }
+            for row in rows
+        ],
+        total=sum(row["gain"] for row in rows) / 100,
+    )
 
 
 @app.route("/buy", methods=["GET", "POST"])
@@ -69,25 +199,11 @@ def buy():
             return apology("Invalid symbol")
 
         user_id = session["user_id"]
-        transaction_value = shares * stock["price"]
-        user_cash_db = db.execute("SELECT cash FROM users WHERE id = ?", user_id)
-        user_cash = user_cash_db[0]["cash"]
-
-        if user_cash < transaction_value:
-            return apology("Not Enough cash.")
-        update_cash = user_cash - transaction_value
-        db.execute("UPDATE users SET cash = ? WHERE id = ?", update_cash, user_id)
-
-        date = datetime.datetime.now()
-
-        db.execute(
-            "INSERT INTO transactions (user_id,symbol,shares,price,date) VALUES (?,?,?,?,?)",
-            user_id,
-            stock["symbol"],
-            shares,
-            stock["price"],
-            date,
-        )
+        try:
+            trades.execute_order(db, user_id, stock["symbol"], shares, to_cents(stock["price"]))
+        except trades.TradeError as e:
+            return apology(str(e))
+        board.refresh_user(db, user_id)
 
         flash("Bought!")
 
@@ -97,12 +213,49 @@ def buy():
 @app.route("/history")
 @login_required
 def history():
-    """Show history of transactions"""
+    """Show history of transactions, newest first, one keyset page at a time"""
     user_id = session["user_id"]
-    transactions_db = db.execute(
-        "SELECT * FROM transactions WHERE user_id = ?", user_id
+
+    # Cursor is "<date>-<id>" of the last row on the previous page
+    before = request.args.get("before", "")
+    try:
+        date, id = (int(part) for part in before.split("-"))
+    except ValueError:
+        transactions_db = db.execute(
+            "SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT ?",
+            user_id,
+            HISTORY_PAGE_SIZE + 1,
+        )
+    else:
+        transactions_db = db.execute(
+            "SELECT * FROM transactions WHERE user_id = ? AND (date, id) < (?, ?) "
+            "ORDER BY date DESC, id DESC LIMIT ?",
+            user_id,
+            date,
+            id,
+            HISTORY_PAGE_SIZE + 1,
+        )
+
+    next_cursor = None
+    if len(transactions_db) > HISTORY_PAGE_SIZE:
+        transactions_db = transactions_db[:HISTORY_PAGE_SIZE]
+        last = transactions_db[-1]
+        next_cursor = f"{last['date']}-{last['id']}"
+    return render_template("history.html", transactions=transactions_db, next_cursor=next_cursor)
+
+
+@app.route("/history/export")
+@login_required
+def history_export():
+    """Stream the full history as CSV or NDJSON"""
+    format = request.args.get("format", "csv")
+    if format not in export.FORMATS:
+        return apology("Unknown export format")
+    return Response(
+        export.stream(db, session["user_id"], format),
+        mimetype=export.FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=history.{format}"},
     )
-    return render_template("history.html", transactions=transactions_db)
 
 
 @app.route("/add_cash", methods=["GET", "POST"])
@@ -117,14 +270,72 @@ def add_cash():
         if int(new_cash) < 0:
             return apology("Negative? Seriously!")
         user_id = session["user_id"]
-        user_cash_db = db.execute("SELECT cash FROM users WHERE id = ?", user_id)
-        user_cash = user_cash_db[0]["cash"]
-
-        update_cash = user_cash + int(new_cash)
-        db.execute("UPDATE users SET cash = ? WHERE id = ?", update_cash, user_id)
+        db.execute("UPDATE users SET cash = cash + ? WHERE id = ?", int(new_cash) * 100, user_id)
+        board.refresh_user(db, user_id)
         return redirect("/")
 
 
+def leaderboard_rows(start, count):
+    """Top rows of the board with usernames attached"""
+    rows = board.top(count, start)
+    names = {}
+    if rows:
+        ids = [user_id for _, user_id, _ in rows]
+        placeholders = ",".join("?" * len(ids))
+        names = dict(db.execute(f"SELECT id, username FROM users WHERE id IN ({placeholders})", *ids, tuples=True))
+    return [
+        {"rank": rank, "user_id": user_id, "username": names.get(user_id), "equity": equity}
+        for rank, user_id, equity in rows
+    ]
+
+
+@app.route("/leaderboard")
+@login_required
+def leaderboard_page():
+    """Show users ranked by total equity, and where the current user stands"""
+    page = max(request.args.get("page", 1, type=int), 1)
+    rows = leaderboard_rows((page - 1) * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE)
+    more = page * LEADERBOARD_PAGE_SIZE < len(board)
+    return render_template("leaderboard.html", rows=rows, mine=board.rank(session["user_id"]), page=page, more=more)
+
+
+@app.route("/api/leaderboard")
+@login_required
+def api_leaderboard():
+    """Top ?limit= users by equity and the current user's rank as JSON (amounts in dollars)"""
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    mine = board.rank(session["user_id"])
+    return jsonify(
+        top=[dict(row, equity=round(row["equity"] / 100, 2)) for row in leaderboard_rows(0, limit)],
+        rank=mine[0] if mine else None,
+        equity=round(mine[1] / 100, 2) if mine else None,
+        users=len(board),
+    )
+
+
+@app.route("/api/prices/<symbol>")
+@login_required
+def api_prices(symbol):
+    """OHLC bars from the local price history as JSON (interval in seconds)"""
+    interval = request.args.get("interval", pricestore.MINUTE, type=int)
+    start = request.args.get("start", type=int)
+    end = request.args.get("end", type=int)
+    if interval <= 0:
+        return apology("Invalid interval")
+    try:
+        bars = price_store.resample(symbol, interval, start, end)
+    except ValueError:
+        return apology("Invalid symbol")
+    return jsonify(
+        symbol=symbol.upper(),
+        interval=interval,
+        bars=[
+            {"time": t, "open": o / 100, "high": h / 100, "low": l / 100, "close": c / 100, "ticks": n}
+            for t, o, h, l, c, n in zip(*(bars[k].tolist() for k in ("time", "open", "high", "low", "close", "ticks")))
+        ],
+    )
+
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     """Log user in"""
@@ -148,9 +359,9 @@ def login():
         )
 
         # Ensure username exists and password is correct
-        if len(rows) != 1 or not check_password_hash(
-            rows[0]["hash"], request.form.get("password")
-        ):
+        with instrumentation.timed("password"):
+            valid = len(rows) == 1 and check_password_hash(rows[0]["hash"], request.form.get("password"))
+        if not valid:
             return apology("invalid username and/or password", 403)
 
         # Remember which user has logged in
@@ -213,7 +424,8 @@ def register():
             return apology("<ust confirm password")
         if password != confirmation:
             return apology("Passwords not match")
-        hash = generate_password_hash(password)
+        with instrumentation.timed("password"):
+            hash = generate_password_hash(password)
         try:
             new_user = db.execute(
                 "INSERT INTO users (username,hash) VALUES (?,?)", username, hash
@@ -221,6 +433,7 @@ def register():
         except:
             return apology("username already exists")
         session["user_id"] = new_user
+        board.refresh_user(db, new_user)
 
         return redirect("/")
 
@@ -232,7 +445,7 @@ def sell():
     if request.method == "GET":
         user_id = session["user_id"]
         symbols_user = db.execute(
-            "SELECT symbol FROM transactions WHERE user_id = ? GROUP BY symbol HAVING SUM (shares) >0 ",
+            "SELECT symbol FROM holdings WHERE user_id = ? AND shares > 0 ORDER BY symbol",
             user_id,
         )
         return render_template(
@@ -255,37 +468,141 @@ def sell():
         if stock is None:
             return apology("Invalid symbol")
 
-        user_shares = db.execute(
-            "SELECT SUM(shares) as shares FROM transactions WHERE user_id = ? AND symbol = ? GROUP BY symbol",
-            user_id,
-            symbol,
-        )
-        if not user_shares or user_shares[0]["shares"] is None:
-            return apology("You do not own any shares of this stock.")
-        user_shares_real = user_shares[0]["shares"]
+        try:
+            trades.execute_order(db, user_id, stock["symbol"], (-1) * shares, to_cents(stock["price"]))
+        except trades.TradeError as e:
+            return apology(str(e))
+        board.refresh_user(db, user_id)
 
-        if shares > user_shares_real:
-            return apology("You do not have this amount of shares.")
+        flash("Sold!")
 
-        transaction_value = shares * stock["price"]
-        user_cash_db = db.execute("SELECT cash FROM users WHERE id = ?", user_id)
-        user_cash = user_cash_db[0]["cash"]
-        update_cash = user_cash + transaction_value
-        db.execute("UPDATE users SET cash = ? WHERE id = ?", update_cash, user_id)
+    return redirect("/")
 
-        date = datetime.datetime.now()
 
-        db.execute(
-            "INSERT INTO transactions (user_id,symbol,shares,price,date) VALUES (?,?,?,?,?)",
-            user_id,
-            stock["symbol"],
-            (-1) * shares,
-            stock["price"],
-            date,
-        )
+def parse_basket():
+    """
+    Orders from the request as [{"symbol", "shares"}] dicts, from a JSON body
+    ({"orders": [...]} or a bare list) or a CSV upload/body with symbol,shares
+    columns. Shares are signed: positive buys, negative sells.
+    """
+    if request.is_json:
+        body = request.get_json(silent=True)
+        rows = body.get("orders") if isinstance(body, dict) else body
+    else:
+        upload = request.files.get("file")
+        text = upload.read().decode("utf-8-sig") if upload else request.get_data(as_text=True)
+        rows = list(csv.DictReader(io.StringIO(text)))
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("No orders")
+    if len(rows) > MAX_BASKET:
+        raise ValueError(f"At most {MAX_BASKET} orders per basket")
+    return [row if isinstance(row, dict) else {} for row in rows]
+
+
+def validate_order(row):
+    """(symbol, shares, error) for one parsed basket row"""
+    symbol = str(row.get("symbol") or "").strip().upper()
+    shares = row.get("shares")
+    if isinstance(shares, str) and shares.strip().lstrip("-").isdigit():
+        shares = int(shares)
+    if not symbol:
+        return symbol, shares, "Input Symbol"
+    if not isinstance(shares, int) or isinstance(shares, bool) or shares == 0:
+        return symbol, shares, "Shares must be a non-zero integer"
+    return symbol, shares, None
+
+
+@app.route("/api/orders", methods=["POST"])
+@login_required
+def api_orders():
+    """Execute a basket of orders all-or-nothing and return per-order results as JSON (amounts in dollars)"""
+    try:
+        rows = parse_basket()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    orders = [validate_order(row) for row in rows]
+    if not any(error for _, _, error in orders):
+        quotes = lookup_many(symbol for symbol, _, _ in orders)
+        orders = [(symbol, shares, None if quotes[symbol] else "Invalid symbol") for symbol, shares, _ in orders]
+
+    def rejected(results):
+        return jsonify(error="Basket rejected", orders=results), 400
+
+    if any(error for _, _, error in orders):
+        return rejected([{"symbol": symbol, "shares": shares, "error": error} for symbol, shares, error in orders])
+
+    prices = {symbol: to_cents(quote["price"]) for symbol, quote in quotes.items()}
+    user_id = session["user_id"]
+    try:
+        results = trades.execute_basket(db, user_id, [(symbol, shares) for symbol, shares, _ in orders], prices)
+    except trades.BasketError as e:
+        results = e.results
+    else:
+        board.refresh_user(db, user_id)
+
+    for result in results:
+        result["price"] = round(result["price"] / 100, 2)
+    if any(result["error"] for result in results):
+        return rejected(results)
+    cash = db.execute("SELECT cash FROM users WHERE id = ?", user_id, tuples=True)[0][0]
+    return jsonify(orders=results, cash=round(cash / 100, 2))
+
+
+@app.cli.command("rebuild-holdings")
+def rebuild_holdings():
+    """Recompute the holdings table from transactions."""
+    count = holdings.rebuild(db)
+    print(f"Rebuilt {count} positions")
+
+
+@app.cli.command("verify-holdings")
+def verify_holdings():
+    """Report positions that disagree with the transactions ledger."""
+    mismatches = holdings.verify(db)
+    for user_id, symbol, expected, actual in mismatches:
+        print(f"user {user_id} {symbol}: ledger {expected}, holdings {actual}")
+    if mismatches:
+        raise SystemExit(1)
+    print("holdings match transactions")
+
+
+@app.cli.command("rebuild-lots")
+@click.option("--method", type=click.Choice(lots.METHODS), help="Method to switch to (default: the saved one)")
+def rebuild_lots(method):
+    """Recompute tax lots and realized gains by replaying transactions, saving the method for new trades."""
+    with db.transaction():
+        if method:
+            lots.switch_method(db, method)
+        else:
+            lots.rebuild(db)
+            method = lots.saved_method(db)
+    print(f"Rebuilt lots using {method}")
+
+
+@app.cli.command("ingest-prices")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("--symbol", help="Symbol for files without a symbol column (default: file name)")
+def ingest_prices(paths, symbol):
+    """Bulk-load CSV bar files into the local price history."""
+    for path in paths:
+        print(f"{path}: {price_store.ingest_csv(path, symbol)} ticks")
+
+
+@app.cli.command("sweep-sessions")
+def sweep_sessions():
+    """Purge expired sessions and print session store metrics."""
+    print(f"Removed {session_store.sweep()} expired sessions")
+    for name, value in session_store.stats().items():
+        print(f"{name}: {value}")
+
+
+@app.cli.command("migrate")
+def migrate():
+    """Apply pending schema migrations to finance.db."""
+    applied = migrations.migrate("finance.db")
+    print(f"Applied migrations {applied}" if applied else "Schema is up to date")
 
-        flash("Sold!")
 
-    return redirect("/")
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,86 @@
+"""
+asyncio quote client.
+
+Lookups share helpers.quote_cache with the synchronous path. Concurrent
+misses for a symbol are coalesced into one task, and upstream connections
+are capped by the client's connector. aiohttp sessions are bound to their
+event loop, so each loop keeps one long-lived AsyncQuoteClient, as asgi.py
+does. The Flask views stay on the blocking helpers.lookup(): under WSGI an
+async view still holds a worker thread, and a client per call would skip
+both the coalescing and the connection pool.
+"""
+import asyncio
+
+import aiohttp
+
+import helpers
+from helpers import parse_quote, quote_cache, quote_params
+
+# Simultaneous upstream connections per client
+CONNECTION_LIMIT = 100
+
+
+class AsyncQuoteClient:
+    """Quote lookups over one pooled aiohttp session."""
+
+    def __init__(self, limit=CONNECTION_LIMIT, timeout=helpers.QUOTE_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._session = None
+        self._inflight = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        for task in self._inflight.values():
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _fetch(self, symbol):
+        try:
+            async with self.session.get(helpers.QUOTE_API_URL, params=quote_params(symbol)) as response:
+                response.raise_for_status()
+                stock = parse_quote(symbol, await response.json(content_type=None))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return quote_cache.fallback(symbol)
+        if stock is not None:
+            quote_cache.put(symbol, stock)
+        return stock
+
+    async def lookup(self, symbol):
+        """Look up quote for symbol; cancelling the caller does not cancel a shared fetch."""
+        symbol = symbol.upper()
+        stock = quote_cache.peek(symbol)
+        if stock is None:
+            task = self._inflight.get(symbol)
+            if task is None:
+                quote_cache.count("misses")
+                task = self._inflight[symbol] = asyncio.ensure_future(self._fetch(symbol))
+                task.add_done_callback(lambda _: self._inflight.pop(symbol, None))
+            else:
+                quote_cache.count("coalesced")
+            stock = await asyncio.shield(task)
+        return dict(stock) if stock is not None else None
+
+    async def lookup_many(self, symbols):
+        """Look up several symbols concurrently; returns a dict keyed by symbol."""
+        symbols = list(dict.fromkeys(s.upper() for s in symbols if s))
+        quotes = await asyncio.gather(*(self.lookup(s) for s in symbols))
+        return dict(zip(symbols, quotes))
@@ -0,0 +1,90 @@
+"""
+ASGI entry point for the finance app.
+
+GET /api/quotes?symbols=AAPL,MSFT is answered directly on the event loop, so
+thousands of slow upstream lookups can be in flight at once without holding
+a worker thread each. Like every other quote path it needs a signed-in user:
+the Flask session cookie is checked for a user_id before anything is fetched.
+
+This is the only asynchronous route. Every other request, /quote, /buy and
+/sell included, is handed to the Flask app and holds a worker thread for
+its whole blocking lookup(), exactly as under a WSGI server.
+
+    uvicorn asgi:app --workers 2
+"""
+import asyncio
+import json
+
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.wrappers import Request
+
+from app import app as flask_app, session_store
+from aquotes import AsyncQuoteClient
+
+# Most symbols accepted by one /api/quotes request
+MAX_SYMBOLS = 50
+
+wsgi = WsgiToAsgi(flask_app)
+client = None
+
+
+async def _send_json(send, status, body):
+    payload = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+def _user_id(scope):
+    """The user_id in the request's Flask session, as login_required reads it, or None."""
+    cookies = b"; ".join(value for name, value in scope.get("headers", []) if name == b"cookie")
+    try:
+        session = flask_app.session_interface.open_session(flask_app, Request({"HTTP_COOKIE": cookies.decode("latin-1")}))
+        return session.get("user_id")
+    finally:
+        session_store.release()
+
+
+async def quotes(scope, receive, send):
+    """Serve current quotes for up to MAX_SYMBOLS comma-separated symbols to a signed-in user."""
+    global client
+    # The session store blocks (SQLite or Redis), so read it off the event loop
+    if await asyncio.to_thread(_user_id, scope) is None:
+        await _send_json(send, 401, {"error": "login required"})
+        return
+    if client is None:
+        client = AsyncQuoteClient()
+    query = parse_qs(scope.get("query_string", b"").decode())
+    symbols = [s for s in ",".join(query.get("symbols", [])).split(",") if s.strip()]
+    if not symbols or len(symbols) > MAX_SYMBOLS:
+        await _send_json(send, 400, {"error": f"pass 1-{MAX_SYMBOLS} symbols"})
+        return
+    await _send_json(send, 200, await client.lookup_many(s.strip() for s in symbols))
+
+
+async def lifespan(receive, send):
+    global client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            client = AsyncQuoteClient()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if client is not None:
+                await client.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/quotes" and scope["method"] == "GET":
+        await quotes(scope, receive, send)
+    else:
+        await wsgi(scope, receive, send)
@@ -0,0 +1,101 @@
+"""
+Load-test the async quote path against a slow local stub server.
+
+Baseline: the blocking lookup() on a fixed pool of worker threads, as
+under a WSGI server. Async: the same number of requests sent concurrently
+to asgi.app's /api/quotes in-process on one event loop, signed in through a
+session written straight to the app's session store.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+import helpers
+import stub_quote_server
+
+
+def symbols(n):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return ["".join(letters[i // 26 ** k % 26] for k in range(3)) + "Q" for i in range(n)]
+
+
+async def asgi_request(app, symbol, cookie):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/quotes",
+        "query_string": f"symbols={symbol}".encode(),
+        "headers": [(b"cookie", cookie.encode())],
+    }
+    await app(scope, receive, send)
+    return json.loads(sent[-1]["body"])
+
+
+async def run_async(asgi, batch, cookie):
+    try:
+        return await asyncio.gather(*(asgi_request(asgi.app, s, cookie) for s in batch))
+    finally:
+        await asgi.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--delay", type=float, default=0.2, help="stub server latency in seconds")
+    parser.add_argument("--workers", type=int, default=8, help="threads for the blocking baseline")
+    args = parser.parse_args()
+
+    server = stub_quote_server.serve(delay=args.delay)
+    helpers.QUOTE_API_URL = f"http://127.0.0.1:{server.server_port}/query"
+
+    # Import the app against a scratch copy of the database so nothing real is touched
+    scratch = tempfile.mkdtemp()
+    shutil.copy(os.path.join(HERE, "finance.db"), scratch)
+    os.chdir(scratch)
+    import asgi
+    import sessions
+    helpers.quote_listeners.clear()
+
+    sid = "bench-async-quotes"
+    asgi.session_store.set(sid, sessions.StoreSessionInterface.serializer.dumps({"user_id": 1}), 3600)
+    cookie = f"{asgi.flask_app.config['SESSION_COOKIE_NAME']}={sid}"
+
+    baseline = symbols(args.requests)
+    helpers.quote_cache.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(helpers.lookup, baseline))
+    blocking = time.perf_counter() - start
+
+    batch = [s + "Z" for s in baseline]
+    start = time.perf_counter()
+    answers = asyncio.run(run_async(asgi, batch, cookie))
+    concurrent = time.perf_counter() - start
+    assert all(next(iter(a.values())) for a in answers)
+    shutil.rmtree(scratch)
+
+    print(f"{args.requests} quote requests, {args.delay * 1000:.0f} ms upstream latency")
+    print(f"  blocking, {args.workers} worker threads: {blocking:6.2f}s  ({args.requests / blocking:7.0f} req/s)")
+    print(f"  asgi /api/quotes, one event loop: {concurrent:6.2f}s  ({args.requests / concurrent:7.0f} req/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Micro-benchmark the cs50.SQL query path against database.Database."""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import migrations
+from trade_stress import LEGACY_SCHEMA
+
+QUERIES = {
+    "cash by id": "SELECT cash FROM users WHERE id = ?",
+    "holdings": "SELECT symbol, shares, price FROM holdings WHERE user_id = ? ORDER BY symbol",
+    "history page": "SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT 50",
+}
+
+
+def build(path, users, rows):
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.executemany(
+        "INSERT INTO users (username, hash) VALUES (?, '')", ((f"user{i}",) for i in range(users))
+    )
+    connection.executemany(
+        "INSERT INTO transactions (user_id, symbol, shares, price, date) VALUES (?, ?, 1, 10.5, '2024-01-01 00:00:00')",
+        ((random.randint(1, users), random.choice("ABCDEFGH")) for _ in range(rows)),
+    )
+    connection.commit()
+    connection.close()
+    migrations.migrate(path)
+
+
+def run(execute, sql, ids):
+    start = time.perf_counter()
+    for user_id in ids:
+        execute(sql, user_id)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    try:
+        from cs50 import SQL
+    except ImportError:
+        SQL = None
+        print("cs50 is not installed; timing database.Database only")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "finance.db")
+        build(path, args.users, args.rows)
+        ids = [random.randint(1, args.users) for _ in range(args.iterations)]
+        db = database.Database(path)
+        old = SQL(f"sqlite:///{path}") if SQL else None
+
+        print(f"{'query':<14} {'cs50.SQL':>12} {'Database':>12} {'tuples':>12}   (us/query)")
+        for name, sql in QUERIES.items():
+            legacy = f"{run(old.execute, sql, ids):12.1f}" if old else f"{'-':>12}"
+            rows = run(db.execute, sql, ids)
+            tuples = run(lambda sql, *a: db.execute(sql, *a, tuples=True), sql, ids)
+            print(f"{name:<14} {legacy} {rows:12.1f} {tuples:12.1f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
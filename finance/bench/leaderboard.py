@@ -0,0 +1,68 @@
+"""Build a leaderboard of simulated users, then time top-N, "my rank", trades and price ticks against a full re-sort."""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leaderboard
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    symbols = [f"S{i}" for i in range(args.symbols)]
+    board = leaderboard.Leaderboard()
+    for symbol in symbols:
+        board.prices[symbol] = rng.randrange(1_000, 50_000)
+
+    users = [
+        (user_id, rng.randrange(0, 10_000_000), {rng.choice(symbols): rng.randrange(1, 100) for _ in range(rng.randrange(0, 6))})
+        for user_id in range(1, args.users + 1)
+    ]
+    start = time.perf_counter()
+    board.set_users(users)
+    print(f"built {len(board):,} users in {time.perf_counter() - start:.1f} s")
+
+    users = [rng.randrange(1, args.users + 1) for _ in range(args.repeat)]
+    top_us, _ = timed(lambda: board.top(10), args.repeat)
+    deep_us, _ = timed(lambda: board.top(10, args.users // 2), args.repeat)
+    ranks = iter(users)
+    rank_us, _ = timed(lambda: board.rank(next(ranks)), args.repeat)
+    trades = iter(users)
+    trade_us, _ = timed(
+        lambda: (lambda u: board.set_user(u, board.cash[u] - 1000, dict(board.positions[u], S0=1)))(next(trades)),
+        args.repeat,
+    )
+    holders = len(board.holders["S1"])
+    tick_us, _ = timed(lambda: board.on_price("S1", board.prices["S1"] + rng.choice((-1, 1))), 20)
+
+    print(f"top 10:                 {top_us:9.1f} us")
+    print(f"10 rows from the middle: {deep_us:8.1f} us")
+    print(f"my rank:                {rank_us:9.1f} us")
+    print(f"trade (rerank a user):  {trade_us:9.1f} us")
+    print(f"price tick ({holders:,} holders): {tick_us / 1000:6.1f} ms")
+
+    # What every request would cost without the board
+    start = time.perf_counter()
+    ordered = sorted(board.equity.items(), key=lambda item: (-item[1], item[0]))
+    print(f"full re-sort:           {(time.perf_counter() - start) * 1000:9.1f} ms")
+    assert [user_id for _, user_id, _ in board.top(10)] == [user_id for user_id, _ in ordered[:10]]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare query plans and latency of the hot ledger queries before and after
+migrations.py on a synthetic transactions table (10M rows by default).
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from trade_stress import LEGACY_SCHEMA
+
+SYMBOLS = ["AAPL", "MSFT", "IBM", "NFLX", "GOOG", "AMZN", "TSLA", "NVDA", "META", "ORCL"]
+
+# name -> (query before migrations, query after migrations)
+QUERIES = {
+    "index": (
+        "SELECT symbol, SUM(shares) AS shares, price FROM transactions WHERE user_id = ? GROUP BY symbol",
+        "SELECT symbol, shares, price FROM holdings WHERE user_id = ? ORDER BY symbol",
+    ),
+    "history": (
+        "SELECT * FROM transactions WHERE user_id = ?",
+        "SELECT * FROM transactions WHERE user_id = ? ORDER BY date, id",
+    ),
+    "sell": (
+        "SELECT SUM(shares) AS shares FROM transactions WHERE user_id = ? AND symbol = ? GROUP BY symbol",
+        "SELECT shares FROM holdings WHERE user_id = ? AND symbol = ?",
+    ),
+}
+
+
+def populate(path, rows, users):
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.executemany(
+        "INSERT INTO users (username, hash, cash) VALUES (?, '', 10000)",
+        ((f"user{i}",) for i in range(users)),
+    )
+    start = time.time() - rows
+    connection.executemany(
+        "INSERT INTO transactions (user_id, symbol, shares, price, date) VALUES (?, ?, ?, ?, datetime(?, 'unixepoch'))",
+        (
+            (random.randint(1, users), random.choice(SYMBOLS), random.randint(1, 10), round(random.uniform(10, 500), 2), start + i)
+            for i in range(rows)
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+
+def measure(connection, sql, users, repeat):
+    params = [(random.randint(1, users),) + (("AAPL",) if sql.count("?") == 2 else ()) for _ in range(repeat)]
+    plan = " / ".join(row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params[0]))
+    start = time.perf_counter()
+    for args in params:
+        connection.execute(sql, args).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000, plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.db")
+        started = time.perf_counter()
+        populate(path, args.rows, args.users)
+        print(f"Generated {args.rows:,} transactions for {args.users:,} users in {time.perf_counter() - started:.1f}s")
+
+        connection = sqlite3.connect(path)
+        before = {name: measure(connection, old, args.users, args.repeat) for name, (old, _) in QUERIES.items()}
+        connection.close()
+
+        started = time.perf_counter()
+        migrations.migrate(path)
+        print(f"Migrated in {time.perf_counter() - started:.1f}s\n")
+
+        connection = sqlite3.connect(path)
+        for name, (_, new) in QUERIES.items():
+            after = measure(connection, new, args.users, args.repeat)
+            print(f"{name}: {before[name][0]:.2f} ms -> {after[0]:.2f} ms")
+            print(f"  before: {before[name][1]}")
+            print(f"  after:  {after[1]}")
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
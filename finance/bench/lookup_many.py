@@ -0,0 +1,46 @@
+"""Compare sequential lookup() against lookup_many() over the stub quote server."""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import helpers
+import stub_quote_server
+
+
+def symbols(n):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return [letters[i // 26 % 26] + letters[i % 26] + "X" for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = stub_quote_server.serve(delay=args.delay)
+    helpers.QUOTE_API_URL = f"http://127.0.0.1:{server.server_port}/query"
+    batch = symbols(args.symbols)
+
+    helpers.quote_cache.clear()
+    start = time.perf_counter()
+    for symbol in batch:
+        helpers.lookup(symbol)
+    sequential = time.perf_counter() - start
+
+    helpers.quote_cache.clear()
+    start = time.perf_counter()
+    quotes = helpers.lookup_many(batch)
+    batched = time.perf_counter() - start
+
+    assert all(quotes.values())
+    print(f"{len(batch)} symbols, {args.delay * 1000:.0f} ms upstream delay")
+    print(f"  lookup() loop:  {sequential:.3f}s  ({len(batch) / sequential:.0f} quotes/s)")
+    print(f"  lookup_many():  {batched:.3f}s  ({len(batch) / batched:.0f} quotes/s)")
+
+
+if __name__ == "__main__":
+    main()
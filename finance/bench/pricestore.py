@@ -0,0 +1,74 @@
+"""Compare PriceStore range queries and minute bars with the same ticks in a SQLite table."""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pricestore
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ticks", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    timestamps = 1_700_000_000 + np.cumsum(rng.integers(0, 3, args.ticks))
+    prices = 10_000 + np.cumsum(rng.integers(-5, 6, args.ticks))
+    # One trading day from the middle of the series
+    start = int(timestamps[args.ticks // 2])
+    end = start + pricestore.DAY
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = pricestore.PriceStore(os.path.join(tmp, "prices"))
+        store.append("BENCH", timestamps, prices)
+
+        connection = sqlite3.connect(os.path.join(tmp, "ticks.db"))
+        connection.execute("CREATE TABLE ticks (symbol TEXT, ts INTEGER, price INTEGER)")
+        connection.execute("CREATE INDEX ticks_symbol_ts ON ticks (symbol, ts)")
+        connection.executemany(
+            "INSERT INTO ticks VALUES ('BENCH', ?, ?)", zip(timestamps.tolist(), prices.tolist())
+        )
+        connection.commit()
+
+        def sqlite_range():
+            return connection.execute(
+                "SELECT ts, price FROM ticks WHERE symbol = 'BENCH' AND ts >= ? AND ts < ?", (start, end)
+            ).fetchall()
+
+        def sqlite_bars():
+            return connection.execute(
+                "SELECT ts / 60 AS bucket, MAX(price), MIN(price), COUNT(*) FROM ticks "
+                "WHERE symbol = 'BENCH' AND ts >= ? AND ts < ? GROUP BY bucket",
+                (start, end),
+            ).fetchall()
+
+        print(f"{args.ticks:,} ticks, querying one day")
+        sql_ms, rows = timed(sqlite_range, args.repeat)
+        store_ms, (ts, _) = timed(lambda: store.range("BENCH", start, end), args.repeat)
+        assert len(rows) == len(ts)
+        print(f"  range:       sqlite {sql_ms:8.2f} ms   pricestore {store_ms:8.3f} ms   ({len(ts):,} ticks)")
+
+        sql_ms, rows = timed(sqlite_bars, args.repeat)
+        store_ms, bars = timed(lambda: store.resample("BENCH", pricestore.MINUTE, start, end), args.repeat)
+        assert len(rows) == len(bars["time"])
+        print(f"  minute bars: sqlite {sql_ms:8.2f} ms   pricestore {store_ms:8.3f} ms   ({len(rows):,} bars)")
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Benchmark the finance app's hot routes at several dataset sizes.
+
+For each USERSxTRANSACTIONS scale (transactions per user) a synthetic
+finance.db is generated in a scratch directory, lookup() is pointed at
+stub_quote_server, and index, history, buy and sell are driven two ways:
+
+- in-process through the Flask test client
+- over HTTP by --processes load-generator processes against a threaded server
+
+Per-route p50/p95/p99 latency, throughput and the app process's peak RSS go
+to a JSON report. Pass --compare with an earlier report to print the change.
+
+    python bench/routes.py --scales 100x100,1000x1000 --output before.json
+    python bench/routes.py --scales 100x100,1000x1000 --output after.json --compare before.json
+"""
+import argparse
+import datetime
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from queue import Empty
+from urllib.parse import urlencode
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+import database
+import holdings
+import lots
+import migrations
+import pricestore
+import stub_quote_server
+
+from trade_stress import LEGACY_SCHEMA
+
+PASSWORD = "bench"
+STARTING_CASH = 10_000_000_000
+SYMBOLS = ["AAPL", "MSFT", "IBM", "NFLX", "GOOG", "AMZN", "TSLA", "NVDA", "META", "ORCL"]
+ROUTES = ("index", "history", "buy", "sell")
+
+
+def generate(path, users, per_user, seed=0):
+    """Write a migrated finance.db with users, a random ledger each, and matching holdings and lots."""
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.close()
+    migrations.migrate(path)
+
+    db = database.Database(path)
+    hash = generate_password_hash(PASSWORD)
+    now = int(time.time())
+    with db.transaction():
+        db.executemany(
+            "INSERT INTO users (id, username, hash, cash) VALUES (?, ?, ?, ?)",
+            [(user_id, f"user{user_id}", hash, 0) for user_id in range(1, users + 1)],
+        )
+        for user_id in range(1, users + 1):
+            owned = dict.fromkeys(SYMBOLS, 0)
+            spent = 0
+            rows = []
+            date = now - per_user * 3600
+            for _ in range(per_user):
+                symbol = rng.choice(SYMBOLS)
+                shares = rng.randint(1, 20)
+                if owned[symbol] and rng.random() < 0.4:
+                    shares = -rng.randint(1, owned[symbol])
+                price = rng.randint(1_000, 50_000)
+                owned[symbol] += shares
+                spent += shares * price
+                date += rng.randint(1, 3600)
+                rows.append((user_id, symbol, shares, price, date))
+            db.executemany(
+                "INSERT INTO transactions (user_id, symbol, shares, price, date) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            db.execute("UPDATE users SET cash = ? WHERE id = ?", STARTING_CASH - spent, user_id)
+    holdings.rebuild(db)
+    with db.transaction():
+        lots.rebuild(db)
+    db.close()
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles in ms and throughput for one route."""
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+
+
+def request_for(route):
+    """(method, path, form) for one request to route."""
+    if route == "index":
+        return "GET", "/", None
+    if route == "history":
+        return "GET", "/history", None
+    return "POST", f"/{route}", {"symbol": "AAPL", "shares": "1"}
+
+
+def run_client(app, requests):
+    """Drive each route through the Flask test client as user1."""
+    client = app.test_client()
+    client.post("/login", data={"username": "user1", "password": PASSWORD})
+    results = {}
+    # Buys before sells, so every sell has shares to sell
+    for route in ROUTES:
+        method, path, form = request_for(route)
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            began = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            latencies.append(time.perf_counter() - began)
+            errors += response.status_code >= 400
+        results[route] = summarize(latencies, errors, time.perf_counter() - start)
+    return results
+
+
+def load_worker(port, route, requests, user_id):
+    """One load-generator process: log in over HTTP, then time requests to route on a keep-alive connection."""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+
+    def send(method, path, form=None, cookie=None):
+        body = urlencode(form) if form else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if form else {}
+        if cookie:
+            headers["Cookie"] = cookie
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+        response.read()
+        if response.getheader("Connection", "").lower() == "close":
+            connection.close()
+        return response
+
+    login = send("POST", "/login", {"username": f"user{user_id}", "password": PASSWORD})
+    cookie = login.getheader("Set-Cookie", "").split(";")[0]
+    method, path, form = request_for(route)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        began = time.perf_counter()
+        response = send(method, path, form, cookie)
+        latencies.append(time.perf_counter() - began)
+        errors += response.status >= 400
+    return latencies, errors, time.perf_counter() - start
+
+
+def run_http(app, users, requests, processes):
+    """Serve the app on a threaded server and hit each route from several processes at once."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    per_process = max(requests // processes, 1)
+    results = {}
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        for route in ROUTES:
+            # Each process trades as its own user, so orders don't contend on one row
+            jobs = [(server.server_port, route, per_process, 2 + i % (users - 1)) for i in range(processes)]
+            outcomes = pool.starmap(load_worker, jobs)
+            latencies = [latency for process_latencies, _, _ in outcomes for latency in process_latencies]
+            errors = sum(process_errors for _, process_errors, _ in outcomes)
+            # Processes run side by side, so the slowest one bounds the wall time
+            results[route] = summarize(latencies, errors, max(elapsed for _, _, elapsed in outcomes))
+    server.shutdown()
+    return results
+
+
+def run_scale(users, per_user, args, queue):
+    """Generate one dataset and benchmark it; runs in its own process so each scale imports a fresh app."""
+    scratch = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        generate(os.path.join(scratch, "finance.db"), users, per_user)
+        generated = time.perf_counter() - start
+
+        stub = stub_quote_server.serve(delay=args.quote_delay)
+        os.environ["QUOTE_API_URL"] = f"http://127.0.0.1:{stub.server_port}/query"
+        os.chdir(scratch)
+        import app as finance
+
+        # Keep recorded ticks out of the real price history
+        finance.price_store = pricestore.PriceStore(os.path.join(scratch, "prices"))
+        app = finance.app
+
+        result = {
+            "users": users,
+            "transactions_per_user": per_user,
+            "generate_seconds": round(generated, 2),
+            "db_bytes": os.path.getsize("finance.db"),
+            "client": run_client(app, args.requests),
+        }
+        if args.processes:
+            result["http"] = run_http(app, users, args.requests, args.processes)
+        # ru_maxrss is in KiB on Linux
+        result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        queue.put(result)
+    finally:
+        os.chdir(HERE)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def compare(old, new):
+    """Print p95 latency and throughput changes per scale, mode and route."""
+    previous = {(s["users"], s["transactions_per_user"]): s for s in old["scales"]}
+    for scale in new["scales"]:
+        key = (scale["users"], scale["transactions_per_user"])
+        if key not in previous:
+            continue
+        print(f"{key[0]}x{key[1]}  peak RSS {previous[key]['peak_rss_mb']} -> {scale['peak_rss_mb']} MB")
+        for mode in ("client", "http"):
+            for route, stats in scale.get(mode, {}).items():
+                before = previous[key].get(mode, {}).get(route)
+                if not before:
+                    continue
+                change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+                print(
+                    f"  {mode:>6} {route:<8} p95 {before['p95_ms']:8.2f} -> {stats['p95_ms']:8.2f} ms ({change:+6.1f}%)"
+                    f"  {before['throughput_rps']:8.1f} -> {stats['throughput_rps']:8.1f} req/s"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", default="100x100,1000x1000", help="comma-separated USERSxTRANSACTIONS per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route per mode")
+    parser.add_argument("--processes", type=int, default=4, help="HTTP load-generator processes (0: test client only)")
+    parser.add_argument("--quote-delay", type=float, default=0.0, help="stub quote server latency in seconds")
+    parser.add_argument("--output", default="bench-routes.json")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "scales": [],
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for scale in args.scales.split(","):
+        users, per_user = (int(part) for part in scale.lower().split("x"))
+        queue = context.Queue()
+        process = context.Process(target=run_scale, args=(users, per_user, args, queue))
+        process.start()
+        while True:
+            try:
+                result = queue.get(timeout=1)
+                break
+            except Empty:
+                if not process.is_alive():
+                    raise SystemExit(f"benchmark for scale {scale} failed")
+        process.join()
+        report["scales"].append(result)
+
+        print(f"{users} users x {per_user} transactions  (peak RSS {result['peak_rss_mb']} MB)")
+        for mode in ("client", "http"):
+            for route, stats in result.get(mode, {}).items():
+                print(
+                    f"  {mode:>6} {route:<8} p50 {stats['p50_ms']:8.2f}  p95 {stats['p95_ms']:8.2f}  "
+                    f"p99 {stats['p99_ms']:8.2f} ms  {stats['throughput_rps']:8.1f} req/s  {stats['errors']} errors"
+                )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
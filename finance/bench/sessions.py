@@ -0,0 +1,48 @@
+"""Time get/set against each session store, and show that stores stay bounded as sessions pile up."""
+import argparse
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sessions
+import stub_redis_server
+
+
+def run(name, store, count, payload):
+    sids = [secrets.token_urlsafe(32) for _ in range(count)]
+
+    start = time.perf_counter()
+    for sid in sids:
+        store.set(sid, payload, 3600)
+    set_us = (time.perf_counter() - start) / count * 1e6
+
+    start = time.perf_counter()
+    for sid in sids:
+        store.get(sid)
+    get_us = (time.perf_counter() - start) / count * 1e6
+
+    stats = store.stats()
+    print(f"{name:>7}: set {set_us:7.1f} us  get {get_us:7.1f} us  size {stats['size']}  evictions {stats['evictions']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--max-entries", type=int, default=10_000)
+    args = parser.parse_args()
+
+    payload = sessions.StoreSessionInterface.serializer.dumps({"user_id": 1, "_flashes": [("message", "Bought!")]})
+    server = stub_redis_server.serve()
+    with tempfile.TemporaryDirectory() as tmp:
+        run("memory", sessions.MemoryStore(args.max_entries), args.sessions, payload)
+        run("sqlite", sessions.SQLiteStore(os.path.join(tmp, "sessions.db")), args.sessions, payload)
+        run("redis", sessions.RedisStore(*server.server_address), args.sessions, payload)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Open and drop price streams through /stream/prices, then time the hub's fan-out.
+
+A scratch finance.db is generated and the app's PriceHub is swapped for one
+polling a fake upstream. Streams are then abandoned every way a client can
+abandon them: HEAD requests, GETs closed before the first event, and GETs
+closed after reading one. After each pass the hub must hold no streams and
+no symbols, or the check fails. Last, --subscribers subscriptions spread over
+--symbols symbols are fanned out to and the delivery time is printed.
+
+    python bench/streams.py --requests 200 --subscribers 100 --symbols 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+import pricestream
+
+from routes import PASSWORD, generate
+
+
+class FakeUpstream:
+    """fetch_many stand-in whose prices move on every call."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, symbols):
+        self.calls += 1
+        return {symbol: {"symbol": symbol, "price": 100 + self.calls} for symbol in symbols}
+
+
+def check_released(finance, requests):
+    client = finance.app.test_client()
+    client.post("/login", data={"username": "user1", "password": PASSWORD})
+    passes = {
+        "HEAD": lambda: client.head("/stream/prices?symbols=AAPL,MSFT"),
+        "GET, closed unread": lambda: client.get("/stream/prices?symbols=AAPL,MSFT", buffered=False),
+        "GET, one event read": lambda: client.get("/stream/prices?symbols=AAPL,MSFT", buffered=False),
+    }
+    failed = False
+    for name, send in passes.items():
+        finance.price_hub = pricestream.PriceHub(fetch_many=FakeUpstream(), interval=0.05)
+        for _ in range(requests):
+            response = send()
+            if response.status_code != 200:
+                raise SystemExit(f"{name}: /stream/prices answered {response.status_code}")
+            if name == "GET, one event read":
+                next(response.response)
+            response.close()
+        hub = finance.price_hub
+        leaked = hub._streams, hub.subscriber_counts()
+        ok = leaked == (0, {})
+        failed |= not ok
+        print(f"{name:>20}: {requests} streams  open after close {leaked[0]}  symbols {leaked[1]}  {'ok' if ok else 'LEAK'}")
+    return not failed
+
+
+def fan_out(subscribers, symbols):
+    upstream = FakeUpstream()
+    hub = pricestream.PriceHub(fetch_many=upstream, interval=0.05, max_streams=subscribers)
+    names = [f"S{i:03d}" for i in range(symbols)]
+    start = time.perf_counter()
+    subscriptions = [hub.subscribe([names[i % symbols], names[(i + 1) % symbols]]) for i in range(subscribers)]
+    for subscription in subscriptions:
+        while subscription.queue.qsize() < len(subscription.symbols):
+            time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    for subscription in subscriptions:
+        hub.unsubscribe(subscription)
+    print(f"fan-out: {subscribers} streams over {symbols} symbols  first prices to all in {elapsed * 1000:.1f} ms  "
+          f"{upstream.calls} upstream calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200, help="abandoned streams per pass (MAX_STREAMS is 100)")
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--symbols", type=int, default=50)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    try:
+        generate(os.path.join(scratch, "finance.db"), 1, 10)
+        os.chdir(scratch)
+        import app as finance
+
+        released = check_released(finance, args.requests)
+        fan_out(args.subscribers, args.symbols)
+    finally:
+        os.chdir(HERE)
+        shutil.rmtree(scratch, ignore_errors=True)
+    if not released:
+        raise SystemExit("streams leaked")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Fire thousands of concurrent orders at a temporary database and check the
+ledger invariants afterwards:
+
+- no user's cash or holdings ever go negative
+- cash equals starting cash minus the net value of the user's ledger
+- holdings equal the per-symbol sum of the ledger
+- open tax lots equal holdings
+
+With --basket-size, each job submits an all-or-nothing basket of that many
+orders through trades.execute_basket instead of a single order.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import holdings
+import migrations
+import trades
+
+# Baseline finance.db schema; migrations bring it up to date
+LEGACY_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, username TEXT NOT NULL, hash TEXT NOT NULL, cash NUMERIC NOT NULL DEFAULT 10000.00);
+CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, user_id INTEGER, symbol TEXT, shares INTEGER, price REAL, date DATETIME);
+"""
+SYMBOLS = ["AAPL", "MSFT", "IBM", "NFLX"]
+STARTING_CASH = 100000
+
+
+def order(db, users, basket_size=0):
+    user_id = random.randint(1, users)
+    try:
+        if basket_size:
+            orders = [(random.choice(SYMBOLS), random.choice([1, 2, 5, -1, -2, -5])) for _ in range(basket_size)]
+            trades.execute_basket(db, user_id, orders, dict.fromkeys(SYMBOLS, 2500))
+        else:
+            shares = random.choice([1, 2, 5, -1, -2, -5])
+            trades.execute_order(db, user_id, random.choice(SYMBOLS), shares, 2500)
+        return True
+    except trades.TradeError:
+        return False
+
+
+def check(db):
+    problems = []
+    for user_id, cash in db.execute("SELECT id, cash FROM users", tuples=True):
+        spent = db.execute(
+            "SELECT COALESCE(SUM(shares * price), 0) FROM transactions WHERE user_id = ?", user_id, tuples=True
+        )[0][0]
+        if cash < 0 or STARTING_CASH - spent != cash:
+            problems.append(f"user {user_id}: cash {cash}, ledger implies {STARTING_CASH - spent}")
+    negative = db.execute("SELECT COUNT(*) FROM holdings WHERE shares < 0", tuples=True)[0][0]
+    if negative:
+        problems.append(f"{negative} negative holdings")
+
+    problems += [f"holdings drift: {m}" for m in holdings.verify(db)]
+    drift = db.execute(
+        "SELECT COUNT(*) FROM (SELECT user_id, symbol, SUM(shares) AS shares FROM lots GROUP BY user_id, symbol) l "
+        "LEFT JOIN holdings h USING (user_id, symbol) WHERE h.shares IS NOT l.shares",
+        tuples=True,
+    )[0][0]
+    if drift:
+        problems.append(f"{drift} positions whose open lots disagree with holdings")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--basket-size", type=int, default=0, help="orders per all-or-nothing basket (0: single orders)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        connection = sqlite3.connect(path)
+        connection.executescript(LEGACY_SCHEMA)
+        connection.close()
+        migrations.migrate(path)
+
+        connection = sqlite3.connect(path)
+        connection.executemany(
+            "INSERT INTO users (username, hash, cash) VALUES (?, '', ?)",
+            [(f"user{i}", STARTING_CASH) for i in range(args.users)],
+        )
+        connection.commit()
+        connection.close()
+
+        db = database.Database(path)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(lambda _: order(db, args.users, args.basket_size), range(args.orders)))
+        elapsed = time.perf_counter() - start
+
+        problems = check(db)
+        db.close()
+        kind = f"baskets of {args.basket_size}" if args.basket_size else "orders"
+        print(f"{args.orders} {kind} on {args.threads} threads in {elapsed:.2f}s: "
+              f"{sum(results)} filled, {len(results) - sum(results)} rejected")
+        for problem in problems:
+            print("  FAIL", problem)
+        if problems:
+            raise SystemExit(1)
+        print("  ledger invariants hold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark valuation.compute() against a pure-Python loop over the same open lots."""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import valuation
+
+
+def python_loop(symbols, shares, costs, quotes):
+    """Reference implementation: one dict update per lot."""
+    totals = {}
+    for symbol, qty, cost in zip(symbols, shares, costs):
+        t = totals.setdefault(symbol, [0, 0])
+        t[0] += qty
+        t[1] += cost
+    return {symbol: held * quotes[symbol] - basis for symbol, (held, basis) in totals.items()}
+
+
+def lots(count, symbols):
+    names = [f"S{i:03d}" for i in range(symbols)]
+    # Sorted by symbol, as load_lots() returns them
+    symbol = sorted(random.choice(names) for _ in range(count))
+    shares = [random.randint(1, 100) for _ in range(count)]
+    costs = [qty * random.randint(1000, 50000) for qty in shares]
+    quotes = {name: random.randint(1000, 50000) for name in names}
+    return symbol, shares, costs, quotes
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'lots':>9} {'python':>10} {'numpy':>10}   (ms per valuation, {args.symbols} symbols)")
+    for count in (1_000, 10_000, 100_000):
+        symbol, shares, costs, quotes = lots(count, args.symbols)
+        arrays = np.array(symbol), np.array(shares, dtype=np.int64), np.array(costs, dtype=np.int64)
+
+        loop_ms, expected = timed(lambda: python_loop(symbol, shares, costs, quotes), args.repeat)
+        numpy_ms, columns = timed(lambda: valuation.compute(*arrays, quotes), args.repeat)
+
+        for name, unrealized in zip(columns["symbol"], columns["unrealized"]):
+            assert np.isclose(unrealized, expected[name])
+        print(f"{count:>9,} {loop_ms:>10.2f} {numpy_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
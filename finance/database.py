@@ -0,0 +1,168 @@
+"""
+Thin SQLite data-access layer for the finance app.
+
+Each thread borrows a connection on first use and keeps it until release(),
+which the app calls when each request's context is torn down. Released
+connections wait in a pool of at most POOL_SIZE for the next thread, so
+thread-per-request servers reuse a few connections instead of opening one
+per thread. Connections are tuned with WAL and the pragmas below. Statements are compiled once per
+connection and kept in sqlite3's statement cache. Rows come back as
+sqlite3.Row, which supports both row["column"] and tuple access, or as plain
+tuples with tuples=True.
+"""
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+STATEMENT_CACHE_SIZE = 256
+
+# Idle connections kept for reuse; any released beyond this are closed
+POOL_SIZE = 8
+
+
+class Database:
+    """Connections to one SQLite file, borrowed per thread from a bounded pool."""
+
+    # Called as tracer(sql, seconds) after each statement when set (see instrumentation.py)
+    tracer = None
+
+    def __init__(self, path, pragmas=PRAGMAS, pool_size=POOL_SIZE):
+        self.path = path
+        self.pragmas = pragmas
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self.path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    @property
+    def connection(self):
+        """This thread's connection, taken from the pool or opened on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = self._open()
+            self._local.connection = connection
+        return connection
+
+    def release(self):
+        """Give this thread's connection back to the pool, or close it if the pool is full."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+        self._local.connection = None
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def execute(self, sql, *args, tuples=False):
+        """
+        Run one statement.
+
+        Returns the rows for queries, the new row id for INSERT and the
+        number of affected rows for any other statement.
+        """
+        if self.tracer is None:
+            return self._execute(sql, args, tuples)
+        start = time.perf_counter()
+        try:
+            return self._execute(sql, args, tuples)
+        finally:
+            self.tracer(sql, time.perf_counter() - start)
+
+    def _execute(self, sql, args, tuples):
+        connection = self.connection
+        if tuples:
+            cursor = connection.cursor()
+            cursor.row_factory = None
+            cursor.execute(sql, args)
+        else:
+            cursor = connection.execute(sql, args)
+        if cursor.description is not None:
+            return cursor.fetchall()
+        if sql.lstrip()[:6].upper() == "INSERT":
+            return cursor.lastrowid
+        return cursor.rowcount
+
+    def executemany(self, sql, rows):
+        """Run one statement for each parameter tuple in rows; return the affected row count."""
+        if self.tracer is None:
+            return self.connection.executemany(sql, rows).rowcount
+        start = time.perf_counter()
+        try:
+            return self.connection.executemany(sql, rows).rowcount
+        finally:
+            self.tracer(sql, time.perf_counter() - start)
+
+    def iterate(self, sql, *args, batch_size=500, tuples=False):
+        """Yield rows from a server-side cursor without materializing the result."""
+        # Only time spent in SQLite is traced, not the caller's work between batches
+        elapsed = 0.0
+        start = time.perf_counter()
+        # A streamed response is read after its request is torn down, so give back a connection borrowed here
+        borrowed = getattr(self._local, "connection", None) is None
+        cursor = self.connection.cursor()
+        if tuples:
+            cursor.row_factory = None
+        cursor.execute(sql, args)
+        try:
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                elapsed += time.perf_counter() - start
+                if not batch:
+                    break
+                yield from batch
+                start = time.perf_counter()
+        finally:
+            cursor.close()
+            if borrowed:
+                self.release()
+            if self.tracer is not None:
+                self.tracer(sql, elapsed)
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Run the enclosed statements in one transaction, rolling back on error."""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield self
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self):
+        """Close this thread's connection and every idle one; others close when their threads end."""
+        self.release()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
@@ -0,0 +1,46 @@
+"""Streamed export of a user's transaction history."""
+import csv
+import datetime
+import io
+import json
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+FIELDS = ["id", "symbol", "shares", "price", "date"]
+BATCH_SIZE = 500
+
+
+def _rows(db, user_id):
+    """Yield the user's transactions oldest first from a server-side cursor."""
+    rows = db.iterate(
+        "SELECT id, symbol, shares, price, date FROM transactions WHERE user_id = ? ORDER BY date, id",
+        user_id,
+        batch_size=BATCH_SIZE,
+        tuples=True,
+    )
+    for id, symbol, shares, price, date in rows:
+        yield {
+            "id": id,
+            "symbol": symbol,
+            "shares": shares,
+            "price": f"{price / 100:.2f}",
+            "date": datetime.datetime.fromtimestamp(date, datetime.timezone.utc).isoformat(),
+        }
+
+
+def stream(db, user_id, format):
+    """Yield the export as chunks of CSV or NDJSON text, one batch at a time."""
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda row: buffer.write(json.dumps(row) + "\n")
+
+    for count, row in enumerate(_rows(db, user_id), 1):
+        write(row)
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
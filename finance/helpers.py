@@ -1,13 +1,34 @@
+import contextvars
 import csv
 import datetime
+import os
 import pytz
 import requests
 import subprocess
+import threading
+import time
 import urllib
 import uuid
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import redirect, render_template, session
 from functools import wraps
+from requests.adapters import HTTPAdapter
+
+# Quote cache tuning (seconds / entries)
+QUOTE_TTL = 15
+QUOTE_STALE_TTL = 60
+QUOTE_CACHE_SIZE = 1024
+
+# Quote API endpoint and connection pool (QUOTE_API_URL may point at stub_quote_server.py)
+QUOTE_API_URL = os.environ.get("QUOTE_API_URL", "https://www.alphavantage.co/query")
+API_KEY = "Your API KEY"
+QUOTE_TIMEOUT = 5
+QUOTE_WORKERS = 8
+
+# Called as listener(quote) after every successful upstream fetch
+quote_listeners = []
 
 
 def apology(message, code=400):
@@ -39,28 +60,220 @@ def login_required(f):
     return decorated_function
 
 
-def lookup(symbol):
-    """Look up quote for symbol using Alpha Vantage."""
-    api_key = "Your API KEY" 
-    url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={api_key}"
-
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if "Global Quote" in data and "05. price" in data["Global Quote"]:
-            price = float(data["Global Quote"]["05. price"])
-            return {
-                "name": symbol.upper(),
-                "price": price,
-                "symbol": symbol.upper()
-            }
+class QuoteCache:
+    """
+    Per-symbol TTL cache for quotes with LRU eviction.
+
+    Concurrent misses for the same symbol are coalesced so that only one
+    caller goes upstream; the others wait for and share its result. When the
+    upstream call fails, an expired entry is served for up to `stale_ttl`
+    seconds past its expiry.
+    """
+
+    class _Flight:
+        def __init__(self):
+            self.event = threading.Event()
+            self.value = None
+
+    def __init__(self, ttl=QUOTE_TTL, stale_ttl=QUOTE_STALE_TTL, maxsize=QUOTE_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.ttls = {}
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = 0
+        self.coalesced = self.errors = self.evictions = 0
+
+    def set_ttl(self, symbol, ttl):
+        """Override the TTL for a single symbol (None restores the default)."""
+        if ttl is None:
+            self.ttls.pop(symbol, None)
         else:
+            self.ttls[symbol] = ttl
+
+    def get(self, symbol, fetch):
+        """Return the cached quote for symbol, calling fetch(symbol) on a miss."""
+        now = time.monotonic()
+        leader = False
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(symbol)
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(symbol)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                flight = self._inflight[symbol] = self._Flight()
+                self.misses += 1
+                leader = True
+        if not leader:
+            flight.event.wait()
+            return flight.value
+
+        try:
+            value, failed = fetch(symbol), False
+        except Exception:
+            value, failed = None, True
+
+        with self._lock:
+            if not failed:
+                if value is not None:
+                    self._store(symbol, value, time.monotonic())
+            elif entry is not None and now < entry[0] + self.stale_ttl:
+                value = entry[1]
+                self.stale += 1
+            else:
+                self.errors += 1
+            del self._inflight[symbol]
+        flight.value = value
+        flight.event.set()
+        return value
+
+    def peek(self, symbol):
+        """Return the fresh cached quote for symbol without fetching, or None."""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and time.monotonic() < entry[0]:
+                self._entries.move_to_end(symbol)
+                self.hits += 1
+                return entry[1]
             return None
-    except Exception:
+
+    def put(self, symbol, value):
+        """Store a quote fetched outside get() (e.g. by the async client)."""
+        with self._lock:
+            self._store(symbol, value, time.monotonic())
+
+    def fallback(self, symbol):
+        """Return the stale quote for symbol after a failed fetch, if still within stale_ttl."""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and time.monotonic() < entry[0] + self.stale_ttl:
+                self.stale += 1
+                return entry[1]
+            self.errors += 1
+            return None
+
+    def count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _store(self, symbol, value, now):
+        self._entries[symbol] = (now + self.ttls.get(symbol, self.ttl), value)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss/stale counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+
+quote_cache = QuoteCache()
+
+# One keep-alive session shared by all lookups, sized for the worker pool
+http = requests.Session()
+http.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=QUOTE_WORKERS))
+http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=QUOTE_WORKERS))
+_quote_pool = ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix="quote")
+
+
+def fetch_quote(symbol):
+    """
+    Fetch a quote for symbol from Alpha Vantage.
+
+    Returns None for an unknown symbol and raises on transport errors or
+    when the API answers without a quote (e.g. a rate-limit notice).
+    """
+    response = http.get(QUOTE_API_URL, params=quote_params(symbol), timeout=QUOTE_TIMEOUT)
+    response.raise_for_status()
+    return parse_quote(symbol, response.json())
+
+
+def quote_params(symbol):
+    """Query parameters for a GLOBAL_QUOTE request."""
+    return {"function": "GLOBAL_QUOTE", "symbol": symbol, "apikey": API_KEY}
+
+
+def parse_quote(symbol, data):
+    """Turn a GLOBAL_QUOTE response into a quote dict and notify quote_listeners."""
+    if "Global Quote" not in data:
+        raise ValueError(f"no quote in response for {symbol}")
+    if "05. price" in data["Global Quote"]:
+        price = float(data["Global Quote"]["05. price"])
+        stock = {
+            "name": symbol.upper(),
+            "price": price,
+            "symbol": symbol.upper()
+        }
+        for listener in quote_listeners:
+            try:
+                listener(stock)
+            except Exception:
+                pass
+        return stock
+    else:
         return None
 
 
+def lookup(symbol):
+    """Look up quote for symbol using Alpha Vantage."""
+    stock = quote_cache.get(symbol.upper(), fetch_quote)
+    return dict(stock) if stock is not None else None
+
+
+def lookup_many(symbols, timeout=QUOTE_TIMEOUT):
+    """
+    Look up quotes for several symbols concurrently.
+
+    Returns a dict keyed by upper-cased symbol; symbols that are unknown or
+    did not answer within timeout seconds map to None.
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols if s))
+    # Run each fetch in a copy of the caller's context so per-request instrumentation follows it
+    futures = {s: _quote_pool.submit(contextvars.copy_context().run, quote_cache.get, s, fetch_quote) for s in symbols}
+    wait(futures.values(), timeout=timeout)
+
+    quotes = {}
+    for symbol, future in futures.items():
+        stock = future.result() if future.done() else None
+        quotes[symbol] = dict(stock) if stock is not None else None
+    return quotes
+
+
 def usd(value):
     """Format value as USD."""
     return f"${value:,.2f}"
+
+
+def to_cents(dollars):
+    """Convert a dollar amount to integer cents."""
+    return int(round(dollars * 100))
+
+
+def cents(value):
+    """Format integer cents as USD."""
+    return usd(value / 100)
+
+
+def timestamp(value):
+    """Format epoch seconds as local date and time."""
+    return datetime.datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,36 @@
+"""Materialized per-user positions, kept in step with the transactions ledger."""
+
+
+def _aggregate(db):
+    """Recompute positions from the full ledger."""
+    # With a single MAX() aggregate, SQLite takes the bare price column from the latest row
+    return db.execute(
+        "SELECT user_id, symbol, SUM(shares) AS shares, price, MAX(id) AS last_id "
+        "FROM transactions GROUP BY user_id, symbol HAVING SUM(shares) != 0"
+    )
+
+
+def rebuild(db):
+    """Replace the contents of holdings with positions recomputed from transactions."""
+    with db.transaction():
+        rows = _aggregate(db)
+        db.execute("DELETE FROM holdings")
+        db.executemany(
+            "INSERT INTO holdings (user_id, symbol, shares, price) VALUES (?, ?, ?, ?)",
+            [(row["user_id"], row["symbol"], row["shares"], row["price"]) for row in rows],
+        )
+    return len(rows)
+
+
+def verify(db):
+    """Return (user_id, symbol, expected, actual) for every position that disagrees with the ledger."""
+    expected = {(r["user_id"], r["symbol"]): r["shares"] for r in _aggregate(db)}
+    actual = {
+        (r["user_id"], r["symbol"]): r["shares"]
+        for r in db.execute("SELECT user_id, symbol, shares FROM holdings")
+    }
+    return [
+        (user_id, symbol, expected.get((user_id, symbol), 0), actual.get((user_id, symbol), 0))
+        for user_id, symbol in sorted(expected.keys() | actual.keys())
+        if expected.get((user_id, symbol), 0) != actual.get((user_id, symbol), 0)
+    ]
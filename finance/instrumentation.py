@@ -0,0 +1,309 @@
+"""
+Opt-in per-request instrumentation.
+
+When enabled, each request records the time it spends in SQL (per
+normalized statement), outbound quote calls, Jinja rendering and password
+hashing. The totals are sent back in a Server-Timing header and aggregated
+for Prometheus at /metrics. With PROFILE_INTERVAL set, a sampling profiler
+also collects the stacks of in-flight requests. For the slowest ones it
+writes folded stacks (input for flamegraph.pl or speedscope) to PROFILE_DIR.
+
+Timings live in a context variable, so they follow a request into
+lookup_many's worker threads.
+
+/metrics answers requests from this host only, or, when METRICS_TOKEN is
+set, requests carrying "Authorization: Bearer <token>". Behind a reverse
+proxy on the same host every request looks local, so set the token there.
+"""
+import contextvars
+import heapq
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import Response, abort, before_render_template, request, template_rendered
+
+# Request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Distinct normalized statements tracked before the rest are lumped together
+MAX_STATEMENTS = 500
+
+_current = contextvars.ContextVar("instrumentation", default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """Statement text with literals as ? and parameter lists collapsed, so variants group together."""
+    sql = _LITERALS.sub("?", sql)
+    sql = _LISTS.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class Recorder:
+    """Phase timings collected during one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.thread = threading.get_ident()
+        self.seconds = defaultdict(float)
+        self.counts = Counter()
+        self.statements = []
+        self.samples = Counter()
+        self.renders = []
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, statement=None):
+        with self._lock:
+            self.seconds[phase] += seconds
+            self.counts[phase] += 1
+            if statement is not None:
+                self.statements.append((statement, seconds))
+
+
+def record(phase, seconds):
+    """Charge seconds to phase of the current request, if it is being recorded."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add(phase, seconds)
+
+
+def record_sql(sql, seconds):
+    """Database tracer: charge one statement to the current request."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add("sql", seconds, sql)
+
+
+@contextmanager
+def timed(phase):
+    """Charge the enclosed block to phase of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def _record_response(response, *args, **kwargs):
+    # requests hook; elapsed runs from sending the request to parsing the headers
+    record("http", response.elapsed.total_seconds())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _family(lines, name, kind, help, samples):
+    """Append one metric family; samples are (suffix, labels, value), the suffix being e.g. "_bucket"."""
+    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{suffix}{{{labels}}} {value}" for suffix, labels, value in samples]
+
+
+def metrics_allowed(token):
+    """Whether this request may read /metrics."""
+    if token:
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+
+class Metrics:
+    """Aggregates finished requests and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.phases = defaultdict(lambda: [0, 0.0])
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def observe(self, endpoint, duration, recorder):
+        statements = [(normalize(sql), seconds) for sql, seconds in recorder.statements]
+        with self._lock:
+            histogram = self.requests.setdefault(endpoint, [[0] * len(BUCKETS), 0, 0.0])
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += duration
+            for phase, seconds in recorder.seconds.items():
+                totals = self.phases[endpoint, phase]
+                totals[0] += recorder.counts[phase]
+                totals[1] += seconds
+            for sql, seconds in statements:
+                if sql not in self.statements and len(self.statements) >= MAX_STATEMENTS:
+                    sql = "other"
+                totals = self.statements[sql]
+                totals[0] += 1
+                totals[1] += seconds
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histogram = []
+            for endpoint, (buckets, count, total) in sorted(self.requests.items()):
+                label = f'endpoint="{_escape(endpoint)}"'
+                histogram += [("_bucket", f'{label},le="{bound}"', hits) for bound, hits in zip(BUCKETS, buckets)]
+                histogram += [("_bucket", f'{label},le="+Inf"', count), ("_sum", label, f"{total:.6f}"), ("_count", label, count)]
+            _family(lines, "finance_request_duration_seconds", "histogram", "Request latency by endpoint.", histogram)
+
+            phases = [(f'endpoint="{_escape(endpoint)}",phase="{phase}"', totals) for (endpoint, phase), totals in sorted(self.phases.items())]
+            _family(lines, "finance_phase_seconds_total", "counter",
+                    "Time spent per request phase (sql, http, render, password).",
+                    [("", labels, f"{seconds:.6f}") for labels, (_, seconds) in phases])
+            _family(lines, "finance_phase_calls_total", "counter", "Operations per request phase.",
+                    [("", labels, calls) for labels, (calls, _) in phases])
+
+            statements = [(f'statement="{_escape(sql)}"', totals) for sql, totals in sorted(self.statements.items())]
+            _family(lines, "finance_sql_statements_total", "counter", "Executions per normalized SQL statement.",
+                    [("", labels, calls) for labels, (calls, _) in statements])
+            _family(lines, "finance_sql_seconds_total", "counter", "Time per normalized SQL statement.",
+                    [("", labels, f"{seconds:.6f}") for labels, (_, seconds) in statements])
+        return "\n".join(lines) + "\n"
+
+
+def _fold(frame):
+    """One stack as root;...;leaf in the folded format used by flamegraph.pl."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """
+    Samples the stacks of threads serving a request every interval seconds
+    and keeps folded-stack files for the keep slowest requests seen.
+    """
+
+    def __init__(self, interval, directory, keep):
+        self.interval = interval
+        self.directory = directory
+        self.keep = keep
+        self.active = {}
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, name="profiler", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for thread, recorder in list(self.active.items()):
+                frame = frames.get(thread)
+                if frame is not None:
+                    recorder.samples[_fold(frame)] += 1
+
+    def start(self, recorder):
+        self.active[recorder.thread] = recorder
+
+    def finish(self, recorder, endpoint, duration):
+        self.active.pop(recorder.thread, None)
+        if not recorder.samples:
+            return
+        with self._lock:
+            if len(self._slowest) >= self.keep and duration <= self._slowest[0][0]:
+                return
+            name = f"{int(time.time())}-{next(self._sequence)}-{endpoint}-{duration * 1000:.0f}ms.folded"
+            path = os.path.join(self.directory, name.replace("/", "_"))
+            with open(path, "w") as f:
+                for stack, count in recorder.samples.items():
+                    f.write(f"{stack} {count}\n")
+            heapq.heappush(self._slowest, (duration, path))
+            if len(self._slowest) > self.keep:
+                _, evicted = heapq.heappop(self._slowest)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+
+def init_app(app, db=None, http=None):
+    """
+    Instrument app. Optional hooks: db (a database.Database) for SQL and
+    http (a requests.Session) for outbound calls. Profiling is configured
+    by PROFILE_INTERVAL (seconds, 0 to disable), PROFILE_DIR and
+    PROFILE_KEEP; METRICS_TOKEN opens /metrics to other hosts.
+    """
+    metrics = Metrics()
+    profiler = None
+    if app.config.get("PROFILE_INTERVAL"):
+        profiler = Profiler(
+            app.config["PROFILE_INTERVAL"],
+            app.config.get("PROFILE_DIR", "profiles"),
+            app.config.get("PROFILE_KEEP", 20),
+        )
+
+    if db is not None:
+        db.tracer = record_sql
+    if http is not None:
+        http.hooks["response"].append(_record_response)
+
+    # Rendering can nest (includes), so keep a stack of start times per request
+    def render_started(sender, template, context, **extra):
+        recorder = _current.get()
+        if recorder is not None:
+            recorder.renders.append(time.perf_counter())
+
+    def render_finished(sender, template, context, **extra):
+        recorder = _current.get()
+        if recorder is not None and recorder.renders:
+            record("render", time.perf_counter() - recorder.renders.pop())
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.before_request
+    def start_recording():
+        recorder = Recorder()
+        request.environ["instrumentation.token"] = _current.set(recorder)
+        if profiler is not None:
+            profiler.start(recorder)
+
+    @app.after_request
+    def report(response):
+        recorder = _current.get()
+        if recorder is None:
+            return response
+        duration = time.perf_counter() - recorder.start
+        endpoint = request.endpoint or "unknown"
+        timings = [
+            f'{phase};dur={recorder.seconds[phase] * 1000:.2f};desc="{recorder.counts[phase]} calls"'
+            for phase in sorted(recorder.seconds)
+        ]
+        timings.append(f"total;dur={duration * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+        metrics.observe(endpoint, duration, recorder)
+        if profiler is not None:
+            profiler.finish(recorder, endpoint, duration)
+        return response
+
+    @app.teardown_request
+    def stop_recording(exc):
+        token = request.environ.pop("instrumentation.token", None)
+        if token is not None:
+            recorder = _current.get()
+            if profiler is not None and recorder is not None:
+                profiler.active.pop(recorder.thread, None)
+            _current.reset(token)
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        if not metrics_allowed(app.config.get("METRICS_TOKEN")):
+            abort(403)
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    return metrics
@@ -0,0 +1,228 @@
+"""
+Cross-user leaderboard of total equity (cash plus holdings at the latest known price).
+
+Equity is kept in an indexable skiplist ordered by (-equity, user_id), so
+reranking a user, "my rank" and the first row of a top-N page all cost
+O(log n). The board is loaded once from the database and then updated
+incrementally: refresh_user() after a trade or deposit, on_price() for each
+quote fetched upstream.
+"""
+import random
+import threading
+
+# Enough levels for ~16M entries at p = 1/2
+MAX_LEVEL = 24
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # width[i] = number of positions from this node to next[i]
+        self.width = [1] * level
+
+
+class RankedSet:
+    """Indexable skiplist of unique, comparable keys with O(log n) insert, remove, rank and index."""
+
+    def __init__(self, keys=()):
+        self._head = _Node(None, MAX_LEVEL)
+        self._size = 0
+        self._random = random.Random()
+        if keys:
+            self._build(sorted(keys))
+
+    def _level(self):
+        # Geometric level: one plus the number of trailing zero bits
+        bits = self._random.getrandbits(MAX_LEVEL - 1) | 1 << (MAX_LEVEL - 1)
+        return (bits & -bits).bit_length()
+
+    def _build(self, keys):
+        """Link sorted keys in one pass, O(n) instead of n inserts."""
+        last = [self._head] * MAX_LEVEL
+        last_position = [0] * MAX_LEVEL
+        for position, key in enumerate(keys, 1):
+            node = _Node(key, self._level())
+            for i in range(len(node.next)):
+                last[i].next[i] = node
+                last[i].width[i] = position - last_position[i]
+                last[i] = node
+                last_position[i] = position
+        self._size = len(keys)
+        for i in range(MAX_LEVEL):
+            last[i].width[i] = self._size + 1 - last_position[i]
+
+    def __len__(self):
+        return self._size
+
+    def _search(self, key):
+        """Return, per level, the last node before key and its position."""
+        chain = [None] * MAX_LEVEL
+        steps = [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for i in reversed(range(MAX_LEVEL)):
+            following = node.next[i]
+            while following is not None and following.key < key:
+                position += node.width[i]
+                node = following
+                following = node.next[i]
+            chain[i] = node
+            steps[i] = position
+        return chain, steps
+
+    def add(self, key):
+        chain, steps = self._search(key)
+        position = steps[0]
+        level = self._level()
+
+        node = _Node(key, level)
+        for i in range(level):
+            previous = chain[i]
+            node.next[i] = previous.next[i]
+            previous.next[i] = node
+            node.width[i] = steps[i] + previous.width[i] - position
+            previous.width[i] = position + 1 - steps[i]
+        for i in range(level, MAX_LEVEL):
+            chain[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._search(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for i in range(MAX_LEVEL):
+            previous = chain[i]
+            if previous.next[i] is node:
+                previous.width[i] += node.width[i] - 1
+                previous.next[i] = node.next[i]
+            else:
+                previous.width[i] -= 1
+        self._size -= 1
+
+    def rank(self, key):
+        """0-based position of key."""
+        chain, steps = self._search(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        return steps[0]
+
+    def slice(self, start, count):
+        """Up to count keys starting at 0-based position start."""
+        node, position = self._head, 0
+        target = start + 1
+        for i in reversed(range(MAX_LEVEL)):
+            while node.next[i] is not None and position + node.width[i] <= target:
+                position += node.width[i]
+                node = node.next[i]
+        if position != target:
+            return []
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """Users ranked by equity in cents, updated incrementally on trades and price ticks."""
+
+    def __init__(self):
+        self.ranking = RankedSet()
+        self.equity = {}
+        self.cash = {}
+        self.positions = {}
+        # symbol -> {user_id: shares}, so a tick only touches its holders
+        self.holders = {}
+        self.prices = {}
+        self._lock = threading.Lock()
+
+    def _equity(self, user_id):
+        return self.cash[user_id] + sum(
+            shares * self.prices.get(symbol, 0) for symbol, shares in self.positions[user_id].items()
+        )
+
+    def _rerank(self, user_id, equity):
+        previous = self.equity.get(user_id)
+        if previous == equity:
+            return
+        if previous is not None:
+            self.ranking.remove((-previous, user_id))
+        self.ranking.add((-equity, user_id))
+        self.equity[user_id] = equity
+
+    def _place(self, user_id, cash, positions):
+        for symbol in self.positions.get(user_id, ()):
+            del self.holders[symbol][user_id]
+        positions = {symbol: shares for symbol, shares in positions.items() if shares}
+        for symbol, shares in positions.items():
+            self.holders.setdefault(symbol, {})[user_id] = shares
+        self.cash[user_id] = cash
+        self.positions[user_id] = positions
+
+    def set_user(self, user_id, cash, positions):
+        """Replace a user's cash (cents) and {symbol: shares} positions and rerank them."""
+        with self._lock:
+            self._place(user_id, cash, positions)
+            self._rerank(user_id, self._equity(user_id))
+
+    def set_users(self, users):
+        """Replace the whole board from (user_id, cash, positions) triples in one bulk build."""
+        with self._lock:
+            self.equity, self.cash, self.positions, self.holders = {}, {}, {}, {}
+            for user_id, cash, positions in users:
+                self._place(user_id, cash, positions)
+                self.equity[user_id] = self._equity(user_id)
+            self.ranking = RankedSet((-equity, user_id) for user_id, equity in self.equity.items())
+
+    def on_price(self, symbol, price):
+        """Revalue every holder of symbol at price (cents)."""
+        with self._lock:
+            change = price - self.prices.get(symbol, 0)
+            self.prices[symbol] = price
+            if not change:
+                return
+            for user_id, shares in self.holders.get(symbol, {}).items():
+                self._rerank(user_id, self.equity[user_id] + shares * change)
+
+    def rank(self, user_id):
+        """1-based rank and equity of user_id, or None if they are not on the board."""
+        with self._lock:
+            equity = self.equity.get(user_id)
+            if equity is None:
+                return None
+            return self.ranking.rank((-equity, user_id)) + 1, equity
+
+    def top(self, count, start=0):
+        """List of (rank, user_id, equity) for count users from 0-based position start."""
+        with self._lock:
+            keys = self.ranking.slice(start, count)
+        return [(start + i + 1, user_id, -negative) for i, (negative, user_id) in enumerate(keys)]
+
+    def __len__(self):
+        return len(self.ranking)
+
+    def load(self, db):
+        """Build the board from users and holdings, pricing each symbol at its latest trade."""
+        # Bare column with MAX(): SQLite returns price from the row holding the latest id
+        for symbol, price, _ in db.execute(
+            "SELECT symbol, price, MAX(id) FROM transactions GROUP BY symbol", tuples=True
+        ):
+            self.prices[symbol] = price
+
+        positions = {}
+        for user_id, symbol, shares in db.iterate("SELECT user_id, symbol, shares FROM holdings", tuples=True):
+            positions.setdefault(user_id, {})[symbol] = shares
+        self.set_users(
+            (user_id, cash, positions.get(user_id, {}))
+            for user_id, cash in db.iterate("SELECT id, cash FROM users", tuples=True)
+        )
+
+    def refresh_user(self, db, user_id):
+        """Reload one user's cash and holdings after a trade or deposit."""
+        cash = db.execute("SELECT cash FROM users WHERE id = ?", user_id, tuples=True)[0][0]
+        rows = db.execute("SELECT symbol, shares FROM holdings WHERE user_id = ?", user_id, tuples=True)
+        self.set_user(user_id, cash, dict(rows))
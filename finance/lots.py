@@ -0,0 +1,172 @@
+"""
+Tax-lot accounting.
+
+Every buy opens a lot in `lots` (remaining shares and their total cost in
+cents) and every sell consumes open lots of that user and symbol. Under
+FIFO the oldest lots are consumed first, under LIFO the newest, and under
+average cost all lots of a symbol are merged into one. Each consumed slice
+is written to `realized_gains` as the sale happens, so reports read those
+rows instead of replaying the ledger.
+
+The method the lots were built with is saved in the `settings` table, and
+every trade matches with it; changing it means rebuilding the lots.
+"""
+
+METHODS = ("fifo", "lifo", "average")
+
+# Lot-matching method until one is saved by switch_method()
+METHOD = "fifo"
+
+# Open lots fetched per round trip while matching a sale
+BATCH_SIZE = 32
+
+
+def saved_method(db):
+    """The lot-matching method the lots table was built with."""
+    rows = db.execute("SELECT value FROM settings WHERE key = 'lot_method'", tuples=True)
+    return rows[0][0] if rows else METHOD
+
+
+def _save_method(db, method):
+    db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('lot_method', ?)", method)
+
+
+def _merge(db, user_id, symbol):
+    """Collapse the open lots of symbol into one; return (id, shares, cost) or None."""
+    rows = db.execute(
+        "SELECT id, shares, cost FROM lots WHERE user_id = ? AND symbol = ? ORDER BY id",
+        user_id,
+        symbol,
+        tuples=True,
+    )
+    if len(rows) > 1:
+        shares = sum(row[1] for row in rows)
+        cost = sum(row[2] for row in rows)
+        db.execute("UPDATE lots SET shares = ?, cost = ? WHERE id = ?", shares, cost, rows[0][0])
+        db.execute(
+            "DELETE FROM lots WHERE user_id = ? AND symbol = ? AND id != ?", user_id, symbol, rows[0][0]
+        )
+        return rows[0][0], shares, cost
+    return rows[0] if rows else None
+
+
+def record_buy(db, user_id, symbol, shares, price, date, method=None):
+    """Open a lot for a purchase of shares at price (cents); call inside the trade's transaction."""
+    method = method or saved_method(db)
+    if method == "average":
+        lot = _merge(db, user_id, symbol)
+        if lot is not None:
+            db.execute(
+                "UPDATE lots SET shares = shares + ?, cost = cost + ? WHERE id = ?",
+                shares,
+                shares * price,
+                lot[0],
+            )
+            return
+    db.execute(
+        "INSERT INTO lots (user_id, symbol, shares, cost, date) VALUES (?, ?, ?, ?, ?)",
+        user_id,
+        symbol,
+        shares,
+        shares * price,
+        date,
+    )
+
+
+def record_sell(db, user_id, symbol, shares, price, date, transaction_id, method=None):
+    """
+    Match a sale of shares at price (cents) against open lots and record the realized gains.
+
+    Only the lots consumed by the sale are read. Returns the number of
+    shares that could not be matched (0 unless the lots are out of step
+    with the ledger).
+    """
+    method = method or saved_method(db)
+    if method == "average":
+        _merge(db, user_id, symbol)
+    descending = method == "lifo"
+    order = "id DESC" if descending else "id"
+    bound = "id < ?" if descending else "id > ?"
+    last_id = 2 ** 63 - 1 if descending else -1
+
+    remaining = shares
+    gains = []
+    while remaining:
+        batch = db.execute(
+            f"SELECT id, shares, cost, date FROM lots WHERE user_id = ? AND symbol = ? AND {bound} "
+            f"ORDER BY {order} LIMIT ?",
+            user_id,
+            symbol,
+            last_id,
+            BATCH_SIZE,
+            tuples=True,
+        )
+        if not batch:
+            break
+        for lot_id, lot_shares, lot_cost, lot_date in batch:
+            take = min(remaining, lot_shares)
+            if take == lot_shares:
+                cost = lot_cost
+                db.execute("DELETE FROM lots WHERE id = ?", lot_id)
+            else:
+                cost = lot_cost * take // lot_shares
+                db.execute(
+                    "UPDATE lots SET shares = shares - ?, cost = cost - ? WHERE id = ?", take, cost, lot_id
+                )
+            gains.append((user_id, symbol, transaction_id, lot_date, take, cost, take * price, date))
+            remaining -= take
+            last_id = lot_id
+            if not remaining:
+                break
+
+    db.executemany(
+        "INSERT INTO realized_gains (user_id, symbol, transaction_id, acquired, shares, cost, proceeds, date) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        gains,
+    )
+    return remaining
+
+
+def rebuild(db, method=None):
+    """
+    Recompute lots and realized gains by replaying the ledger with method
+    (default: the saved one); call inside a transaction.
+    """
+    method = method or saved_method(db)
+    db.execute("DELETE FROM lots")
+    db.execute("DELETE FROM realized_gains")
+    ledger = db.iterate(
+        "SELECT id, user_id, symbol, shares, price, date FROM transactions ORDER BY id", tuples=True
+    )
+    for id, user_id, symbol, shares, price, date in ledger:
+        if shares > 0:
+            record_buy(db, user_id, symbol, shares, price, date, method)
+        elif shares < 0:
+            record_sell(db, user_id, symbol, -shares, price, date, id, method)
+
+
+def switch_method(db, method):
+    """Rebuild the lots with method and save it for later trades; call inside a transaction."""
+    rebuild(db, method)
+    _save_method(db, method)
+
+
+def realized_by_symbol(db, user_id):
+    """Return {symbol: realized gain in cents} for the user."""
+    rows = db.execute(
+        "SELECT symbol, SUM(proceeds - cost) FROM realized_gains WHERE user_id = ? GROUP BY symbol",
+        user_id,
+        tuples=True,
+    )
+    return dict(rows)
+
+
+def realized_gains(db, user_id, start=None, end=None):
+    """Return the user's realized gain rows, optionally limited to sales in [start, end) epoch seconds."""
+    return db.execute(
+        "SELECT symbol, acquired, date, shares, cost, proceeds, proceeds - cost AS gain "
+        "FROM realized_gains WHERE user_id = ? AND date >= ? AND date < ? ORDER BY date, id",
+        user_id,
+        start if start is not None else 0,
+        end if end is not None else 2 ** 63 - 1,
+    )
@@ -0,0 +1,137 @@
+"""
+Versioned schema migrations for finance.db.
+
+The applied version is kept in PRAGMA user_version; each migration runs in
+its own transaction and bumps it. Run directly or via `flask migrate`:
+
+    python migrations.py [finance.db]
+"""
+import sys
+
+import database
+import lots
+
+
+def _script(db, script):
+    """Run ;-separated statements on db inside the caller's transaction."""
+    for statement in script.split(";"):
+        if statement.strip():
+            db.execute(statement)
+
+
+def _holdings(db):
+    """Materialized positions table (see holdings.py)."""
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS holdings ("
+        "user_id INTEGER NOT NULL, symbol TEXT NOT NULL, shares INTEGER NOT NULL, price REAL, "
+        "PRIMARY KEY (user_id, symbol))"
+    )
+    db.execute("DELETE FROM holdings")
+    db.execute(
+        "INSERT INTO holdings (user_id, symbol, shares, price) "
+        "SELECT user_id, symbol, shares, price FROM ("
+        "SELECT user_id, symbol, SUM(shares) AS shares, price, MAX(id) "
+        "FROM transactions GROUP BY user_id, symbol HAVING SUM(shares) != 0)"
+    )
+
+
+def _integer_money_and_time(db):
+    """Store cash and prices as integer cents and dates as integer epoch seconds."""
+    _script(db, """
+        CREATE TABLE users_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, username TEXT NOT NULL,
+            hash TEXT NOT NULL, cash INTEGER NOT NULL DEFAULT 1000000);
+        INSERT INTO users_new (id, username, hash, cash)
+            SELECT id, username, hash, CAST(ROUND(cash * 100) AS INTEGER) FROM users;
+        DROP TABLE users;
+        ALTER TABLE users_new RENAME TO users;
+        CREATE UNIQUE INDEX username ON users (username);
+
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL, shares INTEGER NOT NULL, price INTEGER NOT NULL, date INTEGER NOT NULL);
+        INSERT INTO transactions_new (id, user_id, symbol, shares, price, date)
+            SELECT id, user_id, symbol, shares, CAST(ROUND(price * 100) AS INTEGER),
+                   CAST(strftime('%s', date, 'utc') AS INTEGER)
+            FROM transactions;
+        DROP TABLE transactions;
+        ALTER TABLE transactions_new RENAME TO transactions;
+
+        CREATE TABLE holdings_new (
+            user_id INTEGER NOT NULL, symbol TEXT NOT NULL, shares INTEGER NOT NULL, price INTEGER,
+            PRIMARY KEY (user_id, symbol)) WITHOUT ROWID;
+        INSERT INTO holdings_new (user_id, symbol, shares, price)
+            SELECT user_id, symbol, shares, CAST(ROUND(price * 100) AS INTEGER) FROM holdings;
+        DROP TABLE holdings;
+        ALTER TABLE holdings_new RENAME TO holdings;
+    """)
+
+
+def _ledger_indexes(db):
+    """Covering indexes for per-user history and per-symbol aggregates."""
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS transactions_user_date ON transactions (user_id, date, id)"
+    )
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS transactions_user_symbol ON transactions (user_id, symbol, shares, price)"
+    )
+
+
+def _lots(db):
+    """Tax lots and realized gains (see lots.py), replayed FIFO from the ledger."""
+    _script(db, """
+        CREATE TABLE lots (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, symbol TEXT NOT NULL,
+            shares INTEGER NOT NULL, cost INTEGER NOT NULL, date INTEGER NOT NULL);
+        CREATE INDEX lots_user_symbol ON lots (user_id, symbol, id);
+        CREATE TABLE realized_gains (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, symbol TEXT NOT NULL,
+            transaction_id INTEGER NOT NULL, acquired INTEGER NOT NULL, shares INTEGER NOT NULL,
+            cost INTEGER NOT NULL, proceeds INTEGER NOT NULL, date INTEGER NOT NULL);
+        CREATE INDEX realized_gains_user_date ON realized_gains (user_id, date);
+        CREATE INDEX realized_gains_user_symbol ON realized_gains (user_id, symbol)
+    """)
+    lots.rebuild(db, "fifo")
+
+
+def _settings(db):
+    """Key/value settings; records that lots built before it were matched FIFO."""
+    db.execute("CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    db.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('lot_method', 'fifo')")
+
+
+# (version, migration); append only, never renumber
+MIGRATIONS = [
+    (1, _holdings),
+    (2, _integer_money_and_time),
+    (3, _ledger_indexes),
+    (4, _lots),
+    (5, _settings),
+]
+
+
+def version(db):
+    return db.execute("PRAGMA user_version", tuples=True)[0][0]
+
+
+def migrate(path):
+    """Apply all pending migrations to the database at path; return the versions applied."""
+    db = database.Database(path)
+    applied = []
+    try:
+        for number, migration in MIGRATIONS:
+            if number <= version(db):
+                continue
+            with db.transaction():
+                migration(db)
+                db.execute(f"PRAGMA user_version = {number}")
+            applied.append(number)
+    finally:
+        db.close()
+    return applied
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "finance.db"
+    applied = migrate(path)
+    print(f"Applied migrations {applied}" if applied else "Schema is up to date")
@@ -0,0 +1,227 @@
+"""
+Append-only price history, one pair of columnar files per symbol.
+
+<SYMBOL>.ts holds int64 epoch seconds and <SYMBOL>.px int64 prices in
+cents, both in time order. Reads go through read-only np.memmap views that
+are remapped only when a file has grown, and an in-memory index keeps each
+symbol's row count and last timestamp. Live ticks are appended; a backfill
+that reaches before the last stored tick rewrites the symbol's files once. Range queries are two binary
+searches returning slices of the mapped arrays, without copying.
+
+Several worker processes may share the directory. Writers take an
+exclusive flock on <SYMBOL>.lock and re-read the column lengths under it,
+so their appends never interleave and never rely on a stale in-memory
+count. Readers pick up rows other processes appended the next time they
+read the symbol.
+"""
+import csv
+import datetime
+import fcntl
+import os
+import re
+import threading
+
+from contextlib import contextmanager
+
+import numpy as np
+
+PRICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prices")
+
+MINUTE = 60
+DAY = 86400
+
+# Symbols double as file names, so only allow ticker characters
+SYMBOL = re.compile(r"[A-Z0-9][A-Z0-9.\-]{0,15}")
+
+
+def _check(symbol):
+    symbol = symbol.upper()
+    if not SYMBOL.fullmatch(symbol):
+        raise ValueError(f"invalid symbol: {symbol!r}")
+    return symbol
+
+
+class PriceStore:
+    """Per-symbol memory-mapped tick series."""
+
+    def __init__(self, directory=PRICE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._index = {}
+        self._maps = {}
+        self._lock = threading.Lock()
+        for name in os.listdir(directory):
+            if name.endswith(".ts"):
+                with self._locked(name[:-3]):
+                    self._load(name[:-3])
+
+    def _paths(self, symbol):
+        base = os.path.join(self.directory, _check(symbol))
+        return base + ".ts", base + ".px"
+
+    @contextmanager
+    def _locked(self, symbol):
+        """Hold symbol's lock file exclusively, keeping writers in other processes out."""
+        with open(os.path.join(self.directory, _check(symbol) + ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self, symbol):
+        """
+        Index symbol from disk (caller holds its lock file); a torn append
+        leaves the shorter column authoritative.
+        """
+        ts_path, px_path = self._paths(symbol)
+        sizes = [os.path.getsize(path) if os.path.exists(path) else 0 for path in (ts_path, px_path)]
+        count = min(sizes) // 8
+        for path, size in zip((ts_path, px_path), sizes):
+            if size != count * 8:
+                # Cut the longer column (or a partial row) back, so the next append lines up again
+                with open(path, "ab") as f:
+                    f.truncate(count * 8)
+        last = int(np.fromfile(ts_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0]) if count else None
+        self._index[symbol] = (count, last)
+
+    def symbols(self):
+        # Include symbols other processes have started since this store was opened
+        return sorted(set(self._index) | {name[:-3] for name in os.listdir(self.directory) if name.endswith(".ts")})
+
+    def append(self, symbol, timestamps, prices):
+        """
+        Append ticks for symbol; prices are in cents.
+
+        The batch is sorted by time and appended. If it reaches before the
+        last stored tick, the series is merged and rewritten instead. Returns
+        the number of ticks written.
+        """
+        symbol = _check(symbol)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.int64)
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, prices = timestamps[order], prices[order]
+
+        if not len(timestamps):
+            return 0
+        with self._lock, self._locked(symbol):
+            # Another process may have appended since this one last looked
+            self._load(symbol)
+            count, last = self._index[symbol]
+            if last is not None and timestamps[0] < last:
+                self._merge(symbol, timestamps, prices)
+                return len(timestamps)
+            ts_path, px_path = self._paths(symbol)
+            with open(ts_path, "ab") as f:
+                f.write(timestamps.tobytes())
+            with open(px_path, "ab") as f:
+                f.write(prices.tobytes())
+            self._index[symbol] = (count + len(timestamps), int(timestamps[-1]))
+        return len(timestamps)
+
+    def _merge(self, symbol, timestamps, prices):
+        """Rewrite symbol's files with the batch merged in time order (caller holds both locks)."""
+        old_ts, old_px = self._columns(symbol)
+        merged_ts = np.concatenate([old_ts, timestamps])
+        merged_px = np.concatenate([old_px, prices])
+        order = np.argsort(merged_ts, kind="stable")
+        for path, column in zip(self._paths(symbol), (merged_ts[order], merged_px[order])):
+            column.tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        self._maps.pop(symbol, None)
+        self._index[symbol] = (len(merged_ts), int(merged_ts[order[-1]]))
+
+    def record(self, symbol, price, timestamp=None):
+        """Append a single tick (price in cents), timestamped now by default."""
+        when = int(timestamp if timestamp is not None else datetime.datetime.now().timestamp())
+        return self.append(symbol, [when], [price])
+
+    def _columns(self, symbol):
+        """Return memory-mapped (timestamps, prices) for symbol, remapping if it has grown."""
+        symbol = _check(symbol)
+        count = self._rows(symbol)
+        if not count:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        mapped = self._maps.get(symbol)
+        if mapped is None or mapped[0] != count:
+            ts_path, px_path = self._paths(symbol)
+            mapped = (
+                count,
+                np.memmap(ts_path, dtype=np.int64, mode="r", shape=(count,)),
+                np.memmap(px_path, dtype=np.int64, mode="r", shape=(count,)),
+            )
+            self._maps[symbol] = mapped
+        return mapped[1], mapped[2]
+
+    def _rows(self, symbol):
+        """Complete rows of symbol on disk, updating the index if another process changed them."""
+        ts_path, px_path = self._paths(symbol)
+        try:
+            count = min(os.path.getsize(ts_path), os.path.getsize(px_path)) // 8
+        except OSError:
+            return 0
+        if count != self._index.get(symbol, (0, None))[0]:
+            last = int(np.fromfile(ts_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0]) if count else None
+            self._index[symbol] = (count, last)
+        return count
+
+    def range(self, symbol, start=None, end=None):
+        """Return (timestamps, prices) views for ticks with start <= ts < end."""
+        timestamps, prices = self._columns(symbol)
+        lo = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side="left")
+        return timestamps[lo:hi], prices[lo:hi]
+
+    def last(self, symbol):
+        """Return the most recent (timestamp, price) for symbol, or None."""
+        timestamps, prices = self._columns(symbol)
+        if not len(timestamps):
+            return None
+        return int(timestamps[-1]), int(prices[-1])
+
+    def resample(self, symbol, interval=MINUTE, start=None, end=None):
+        """
+        Aggregate ticks into OHLC bars of interval seconds.
+
+        Returns a dict of arrays: bar start time, open, high, low, close and
+        tick count. Buckets without ticks are omitted.
+        """
+        timestamps, prices = self.range(symbol, start, end)
+        if not len(timestamps):
+            empty = np.zeros(0, dtype=np.int64)
+            return {"time": empty, "open": empty, "high": empty, "low": empty, "close": empty, "ticks": empty}
+        buckets = timestamps // interval
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)]
+        return {
+            "time": buckets[starts] * interval,
+            "open": prices[starts],
+            "high": np.maximum.reduceat(prices, starts),
+            "low": np.minimum.reduceat(prices, starts),
+            "close": prices[ends - 1],
+            "ticks": ends - starts,
+        }
+
+    def ingest_csv(self, path, symbol=None):
+        """
+        Bulk-load a CSV bar file and return the number of ticks written.
+
+        The file needs a `timestamp` (epoch seconds or ISO date/time) or
+        `date` column and a `close` or `price` column in dollars. The symbol
+        comes from a `symbol` column or, failing that, the file name.
+        """
+        default = (symbol or os.path.splitext(os.path.basename(path))[0]).upper()
+        batches = {}
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                row = {key.strip().lower(): value for key, value in row.items() if key}
+                when = row.get("timestamp") or row.get("date") or row.get("time")
+                price = row.get("close") or row.get("price")
+                if not when or not price:
+                    continue
+                when = int(when) if when.isdigit() else int(datetime.datetime.fromisoformat(when).timestamp())
+                times, prices = batches.setdefault((row.get("symbol") or default).upper(), ([], []))
+                times.append(when)
+                prices.append(round(float(price) * 100))
+        return sum(self.append(sym, times, prices) for sym, (times, prices) in batches.items())
@@ -0,0 +1,152 @@
+"""
+Fan-out of live quotes to Server-Sent Events subscribers.
+
+One background poller serves every stream: each interval it fetches all
+subscribed symbols in a single lookup_many() call and pushes changed prices
+to the queues of their subscribers, so upstream calls scale with distinct
+symbols rather than with viewers, and threads do not scale with either. The
+poller starts with the first subscriber and exits after the last one
+leaves. Each open stream also holds a server worker, so the hub accepts at
+most MAX_STREAMS streams and MAX_SYMBOLS distinct symbols at a time.
+"""
+import json
+import queue
+import threading
+
+from helpers import QUOTE_TTL, lookup_many
+
+# Seconds between polls, and between keep-alive comments on idle streams
+POLL_INTERVAL = QUOTE_TTL
+KEEPALIVE = 15
+
+# Updates buffered per subscriber before the oldest are dropped
+QUEUE_SIZE = 100
+
+# Open streams, distinct symbols across them, and symbols in one stream
+MAX_STREAMS = 100
+MAX_SYMBOLS = 500
+MAX_SYMBOLS_PER_STREAM = 50
+
+
+class HubFull(Exception):
+    """Subscription refused because it would pass one of the hub's limits."""
+
+
+class Subscription:
+    """A subscriber's queue of {"symbol", "price"} updates."""
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.closed = False
+
+    def put(self, update):
+        while True:
+            try:
+                self.queue.put_nowait(update)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+class PriceHub:
+    """Subscribers per symbol, all served by one shared poller thread."""
+
+    def __init__(self, fetch_many=lookup_many, interval=POLL_INTERVAL,
+                 max_streams=MAX_STREAMS, max_symbols=MAX_SYMBOLS):
+        self.fetch_many = fetch_many
+        self.interval = interval
+        self.max_streams = max_streams
+        self.max_symbols = max_symbols
+        self._subscribers = {}
+        self._last = {}
+        self._streams = 0
+        self._poller = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self.polls = 0
+
+    def subscribe(self, symbols):
+        """Subscribe to symbols; the latest known prices are queued immediately. Raises HubFull."""
+        subscription = Subscription(sorted({s.upper() for s in symbols}))
+        with self._lock:
+            new = [symbol for symbol in subscription.symbols if symbol not in self._subscribers]
+            if len(subscription.symbols) > MAX_SYMBOLS_PER_STREAM:
+                raise HubFull(f"at most {MAX_SYMBOLS_PER_STREAM} symbols per stream")
+            if self._streams >= self.max_streams:
+                raise HubFull("too many open price streams")
+            if len(self._subscribers) + len(new) > self.max_symbols:
+                raise HubFull("too many symbols watched")
+            self._streams += 1
+            for symbol in subscription.symbols:
+                self._subscribers.setdefault(symbol, set()).add(subscription)
+                if symbol in self._last:
+                    subscription.put({"symbol": symbol, "price": self._last[symbol]})
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="price-poller", daemon=True)
+                self._poller.start()
+            elif new:
+                # Fetch the new symbols now rather than at the end of the current interval
+                self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Drop subscription; safe to call more than once."""
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            self._streams -= 1
+            for symbol in subscription.symbols:
+                subscribers = self._subscribers.get(symbol)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[symbol]
+                    self._last.pop(symbol, None)
+
+    def subscriber_counts(self):
+        with self._lock:
+            return {symbol: len(subscribers) for symbol, subscribers in self._subscribers.items()}
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                symbols = list(self._subscribers)
+                if not symbols:
+                    # Decided under the lock, so a new subscriber starts a fresh poller
+                    self._poller = None
+                    return
+            quotes = self.fetch_many(symbols)
+            self.polls += 1
+            updates = []
+            with self._lock:
+                for symbol, stock in quotes.items():
+                    if stock is None or symbol not in self._subscribers:
+                        continue
+                    if self._last.get(symbol) != stock["price"]:
+                        self._last[symbol] = stock["price"]
+                        updates.append(({"symbol": symbol, "price": stock["price"]}, list(self._subscribers[symbol])))
+            for update, subscribers in updates:
+                for subscription in subscribers:
+                    subscription.put(update)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def events(self, subscription):
+        """Yield SSE-formatted updates for subscription until the client goes away."""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    update = subscription.queue.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: price\ndata: {json.dumps(update)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,387 @@
+"""
+Server-side sessions with pluggable, bounded stores.
+
+The browser only holds a random session id. Session data lives in one of:
+
+- MemoryStore: in-process LRU dict, capped at maxsize sessions
+- SQLiteStore: a table in its own SQLite file, shared by all workers
+- RedisStore: any server speaking the Redis protocol (see stub_redis_server.py)
+
+Every store expires sessions after SESSION_LIFETIME seconds without a
+write. A background sweeper, started by the first request so CLI commands
+do not run one, purges expired entries, and each store counts hits,
+misses, writes and expirations in stats().
+"""
+import os
+import re
+import secrets
+import socket
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import database
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+
+
+class SessionStore(ABC):
+    """Interface and shared counters for session stores; data is bytes, ttl is seconds."""
+
+    def __init__(self):
+        self.counters = dict.fromkeys(("hits", "misses", "writes", "deletes", "expired", "evictions"), 0)
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._counter_lock:
+            self.counters[name] += n
+
+    @abstractmethod
+    def get(self, sid):
+        """Return (data, expires_at) for a live session, or None."""
+
+    @abstractmethod
+    def set(self, sid, data, ttl):
+        pass
+
+    @abstractmethod
+    def touch(self, sid, ttl):
+        """Push back the expiry of an unchanged session."""
+
+    @abstractmethod
+    def delete(self, sid):
+        pass
+
+    def sweep(self):
+        """Purge expired sessions and return how many were removed."""
+        return 0
+
+    def release(self):
+        """Give back anything this thread borrowed; called at the end of each request."""
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    def stats(self):
+        with self._counter_lock:
+            return dict(self.counters, size=len(self))
+
+
+class MemoryStore(SessionStore):
+    """Per-process LRU store; sessions are lost on restart and not shared between workers."""
+
+    def __init__(self, maxsize=10000):
+        super().__init__()
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None and entry[1] <= now:
+                del self._entries[sid]
+                entry = None
+                self._count("expired")
+            if entry is None:
+                self._count("misses")
+                return None
+            self._entries.move_to_end(sid)
+        self._count("hits")
+        return entry
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._entries[sid] = (data, time.time() + ttl)
+            self._entries.move_to_end(sid)
+            evicted = 0
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self._count("writes")
+        if evicted:
+            self._count("evictions", evicted)
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                self._entries[sid] = (entry[0], time.time() + ttl)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+        self._count("deletes")
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._entries.items() if expires <= now]
+            for sid in expired:
+                del self._entries[sid]
+        self._count("expired", len(expired))
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore(SessionStore):
+    """Sessions in a SQLite table keyed by id, with an index on expiry for sweeping."""
+
+    def __init__(self, path="sessions.db"):
+        super().__init__()
+        self.db = database.Database(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+    def get(self, sid):
+        rows = self.db.execute(
+            "SELECT data, expires FROM sessions WHERE id = ? AND expires > ?", sid, time.time(), tuples=True
+        )
+        self._count("hits" if rows else "misses")
+        return rows[0] if rows else None
+
+    def set(self, sid, data, ttl):
+        self.db.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)", sid, data, time.time() + ttl
+        )
+        self._count("writes")
+
+    def touch(self, sid, ttl):
+        self.db.execute("UPDATE sessions SET expires = ? WHERE id = ?", time.time() + ttl, sid)
+
+    def delete(self, sid):
+        self.db.execute("DELETE FROM sessions WHERE id = ?", sid)
+        self._count("deletes")
+
+    def sweep(self):
+        removed = self.db.execute("DELETE FROM sessions WHERE expires <= ?", time.time())
+        self._count("expired", removed)
+        return removed
+
+    def release(self):
+        self.db.release()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM sessions", tuples=True)[0][0]
+
+
+class RedisError(RuntimeError):
+    """An error reply from the Redis server."""
+
+
+class RedisStore(SessionStore):
+    """
+    Sessions as Redis keys with EX expiry, over a minimal RESP client.
+
+    Redis expires keys itself, so sweep() has nothing to do. Each thread
+    keeps one connection to the server.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, prefix="session:", timeout=2):
+        super().__init__()
+        self.address = (host, port)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = self._local.connection = (sock, sock.makefile("rb"))
+        return connection
+
+    def command(self, *args):
+        """Send one command and return its decoded reply."""
+        return self.pipeline(args)[0]
+
+    def pipeline(self, *commands):
+        """
+        Send several commands in one write and return their replies in order.
+
+        Every reply is read before the first error reply is raised as a
+        RedisError, so the connection stays in step with the server. Any
+        other failure while reading leaves it out of step, and it is closed.
+        """
+        parts = []
+        for args in commands:
+            parts.append(f"*{len(args)}\r\n".encode())
+            for arg in args:
+                arg = arg if isinstance(arg, bytes) else str(arg).encode()
+                parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b"".join(parts))
+            replies = [self._reply(reader) for _ in commands]
+        except Exception:
+            self._local.connection = None
+            sock.close()
+            raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            return None if length < 0 else reader.read(length + 2)[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._reply(reader) for _ in range(count)]
+        raise RuntimeError(f"unexpected reply {line!r}")
+
+    def get(self, sid):
+        # One round trip for the value and its remaining lifetime
+        data, ttl = self.pipeline(("GET", self.prefix + sid), ("TTL", self.prefix + sid))
+        self._count("hits" if data is not None else "misses")
+        return (data, time.time() + max(ttl, 0)) if data is not None else None
+
+    def set(self, sid, data, ttl):
+        self.command("SET", self.prefix + sid, data, "EX", int(ttl))
+        self._count("writes")
+
+    def touch(self, sid, ttl):
+        self.command("EXPIRE", self.prefix + sid, int(ttl))
+
+    def delete(self, sid):
+        self.command("DEL", self.prefix + sid)
+        self._count("deletes")
+
+    def __len__(self):
+        # DBSIZE would count every key in a shared database, not just sessions
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self.prefix) + "*"
+        count, cursor = 0, 0
+        while True:
+            cursor, keys = self.command("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            count += len(keys)
+            if cursor == b"0":
+                return count
+
+
+class StoreSessionInterface(SessionInterface):
+    """Flask session interface that keeps session data in a SessionStore."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, lifetime):
+        self.store = store
+        self.lifetime = lifetime
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.get(sid)
+            if entry is not None:
+                data, expires = entry
+                return ServerSideSession(self.serializer.loads(data), sid=sid, expires=expires)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), self.lifetime)
+        elif session.expires is not None and session.expires - time.time() < self.lifetime / 2:
+            self.store.touch(session.sid, self.lifetime)
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def _sweep(store, interval, logger):
+    while True:
+        time.sleep(interval)
+        try:
+            store.sweep()
+        except Exception:
+            logger.exception("session sweep failed")
+
+
+def init_app(app):
+    """
+    Install server-side sessions configured by SESSION_BACKEND ("memory",
+    "sqlite" or "redis"), SESSION_LIFETIME and SESSION_SWEEP_INTERVAL.
+    """
+    backend = app.config.get("SESSION_BACKEND", "sqlite")
+    if backend == "memory":
+        store = MemoryStore(app.config.get("SESSION_MAX_ENTRIES", 10000))
+    elif backend == "sqlite":
+        store = SQLiteStore(app.config.get("SESSION_SQLITE_PATH", "sessions.db"))
+    elif backend == "redis":
+        store = RedisStore(app.config.get("SESSION_REDIS_HOST", "127.0.0.1"), app.config.get("SESSION_REDIS_PORT", 6379))
+    else:
+        raise ValueError(f"unknown SESSION_BACKEND {backend!r}")
+
+    app.session_interface = StoreSessionInterface(store, app.config.get("SESSION_LIFETIME", 86400))
+    # Sessions are saved before the app context is torn down
+    app.teardown_appcontext(lambda exc: store.release())
+
+    # Started by the first request, so importing the app for a CLI command does not sweep
+    sweeper = []
+    sweeper_lock = threading.Lock()
+
+    @app.before_request
+    def start_sweeper():
+        if sweeper:
+            return
+        with sweeper_lock:
+            if not sweeper:
+                sweeper.append(threading.Thread(
+                    target=_sweep, args=(store, app.config.get("SESSION_SWEEP_INTERVAL", 300), app.logger),
+                    name="session-sweeper", daemon=True,
+                ))
+                sweeper[0].start()
+
+    return store
@@ -0,0 +1,74 @@
+"""
+Local stand-in for the Alpha Vantage GLOBAL_QUOTE endpoint.
+
+Run it and point the app at it to exercise lookups without network access:
+
+    python stub_quote_server.py --port 8765 --delay 0.05
+    QUOTE_API_URL=http://127.0.0.1:8765/query flask run
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def stub_price(symbol):
+    """Deterministic pseudo-price for symbol."""
+    return round(10 + zlib.crc32(symbol.encode()) % 49000 / 100, 2)
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        symbol = query.get("symbol", [""])[0].upper()
+        if self.delay:
+            time.sleep(self.delay)
+
+        # Unknown symbols get an empty quote, just like the real API
+        if symbol.isalpha() and len(symbol) <= 5:
+            quote = {"01. symbol": symbol, "05. price": f"{stub_price(symbol):.4f}"}
+        else:
+            quote = {}
+        self.server.requests += 1
+
+        body = json.dumps({"Global Quote": quote}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=0, delay=0.0):
+    """Start the stub server in a daemon thread and return it (see server.server_port)."""
+    handler = type("Handler", (QuoteHandler,), {"delay": delay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+
+    handler = type("Handler", (QuoteHandler,), {"delay": args.delay})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.requests = 0
+    print(f"Serving stub quotes on http://{args.host}:{args.port}/query")
+    server.serve_forever()
@@ -0,0 +1,122 @@
+"""
+Local stand-in for a Redis server, enough for the session store.
+
+Speaks RESP and supports PING, GET, SET (with EX), DEL, EXPIRE, TTL,
+DBSIZE and SCAN (MATCH with fnmatch patterns), with lazy expiry on access. Run it and point the app at it:
+
+    python stub_redis_server.py --port 6390
+    SESSION_BACKEND=redis SESSION_REDIS_PORT=6390 flask run
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            try:
+                args = self.read_command()
+            except (ConnectionError, ValueError):
+                return
+            if args is None:
+                return
+            self.wfile.write(self.server.dispatch(args))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ValueError("inline commands are not supported")
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+def bulk(value):
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+        self.commands = 0
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            entry = None
+        return entry
+
+    def dispatch(self, args):
+        name, args = args[0].upper(), args[1:]
+        with self.lock:
+            self.commands += 1
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name == b"GET":
+                entry = self._live(args[0])
+                return bulk(entry[0] if entry else None)
+            if name == b"SET":
+                expires = None
+                if len(args) == 4 and args[2].upper() == b"EX":
+                    expires = time.time() + int(args[3])
+                self.data[args[0]] = (args[1], expires)
+                return b"+OK\r\n"
+            if name == b"DEL":
+                removed = sum(self.data.pop(key, None) is not None for key in args)
+                return b":%d\r\n" % removed
+            if name == b"EXPIRE":
+                entry = self._live(args[0])
+                if entry is None:
+                    return b":0\r\n"
+                self.data[args[0]] = (entry[0], time.time() + int(args[1]))
+                return b":1\r\n"
+            if name == b"TTL":
+                entry = self._live(args[0])
+                if entry is None:
+                    return b":-2\r\n"
+                return b":%d\r\n" % (-1 if entry[1] is None else int(entry[1] - time.time()))
+            if name == b"DBSIZE":
+                return b":%d\r\n" % sum(self._live(key) is not None for key in list(self.data))
+            if name == b"SCAN":
+                # SCAN cursor [MATCH pattern] [COUNT n]; the cursor is an offset into the sorted keys
+                options = {args[i].upper(): args[i + 1] for i in range(1, len(args) - 1, 2)}
+                pattern = options.get(b"MATCH", b"*").decode()
+                start, count = int(args[0]), int(options.get(b"COUNT", 10))
+                keys = sorted(key for key in list(self.data) if self._live(key) is not None)
+                page = keys[start:start + count]
+                cursor = start + count if start + count < len(keys) else 0
+                matched = [key for key in page if fnmatch.fnmatchcase(key.decode(), pattern)]
+                return b"*2\r\n" + bulk(str(cursor).encode()) + b"*%d\r\n" % len(matched) + b"".join(bulk(key) for key in matched)
+        return b"-ERR unknown command '%s'\r\n" % name
+
+
+def serve(host="127.0.0.1", port=0):
+    """Start the stand-in in a daemon thread and return it (see server.server_address)."""
+    server = RedisServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server = RedisServer((args.host, args.port))
+    print(f"Serving RESP on {args.host}:{args.port}")
+    server.serve_forever()
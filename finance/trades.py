@@ -0,0 +1,176 @@
+"""Atomic order execution against the finance database."""
+import random
+import sqlite3
+import time
+
+import lots
+
+# How many times an order is retried after SQLite's busy timeout expires
+RETRIES = 5
+
+
+class TradeError(Exception):
+    """Order rejected because the user lacks the cash or shares for it."""
+
+
+class BasketError(TradeError):
+    """Basket rejected as a whole; results has one entry per order, with an error on each rejected one."""
+
+    def __init__(self, results):
+        super().__init__("Basket rejected")
+        self.results = results
+
+
+def _with_retries(db, fn):
+    """Run fn() in a BEGIN IMMEDIATE transaction, retrying with backoff while the database is busy."""
+    for attempt in range(RETRIES):
+        try:
+            with db.transaction():
+                return fn()
+        except sqlite3.OperationalError as e:
+            busy = "locked" in str(e) or "busy" in str(e)
+            if not busy or attempt == RETRIES - 1:
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+
+def execute_order(db, user_id, symbol, shares, price):
+    """
+    Buy (shares > 0) or sell (shares < 0) symbol at price (integer cents) for user_id.
+
+    Cash, the ledger, holdings and tax lots are updated in one BEGIN IMMEDIATE
+    transaction, and cash/shares are only debited by conditional updates,
+    so concurrent orders can neither lose updates nor overdraw. Returns the
+    new transactions row id; raises TradeError if the order is rejected.
+    """
+    if shares == 0:
+        raise ValueError("shares must be non-zero")
+    return _with_retries(db, lambda: _execute(db, user_id, symbol, shares, price))
+
+
+def _execute(db, user_id, symbol, shares, price):
+    value = abs(shares) * price
+    date = int(time.time())
+    if shares > 0:
+        debited = db.execute(
+            "UPDATE users SET cash = cash - ? WHERE id = ? AND cash >= ?", value, user_id, value
+        )
+        if debited != 1:
+            raise TradeError("Not Enough cash.")
+        db.execute(
+            "INSERT INTO holdings (user_id, symbol, shares, price) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id, symbol) DO UPDATE SET shares = shares + excluded.shares, price = excluded.price",
+            user_id,
+            symbol,
+            shares,
+            price,
+        )
+    else:
+        debited = db.execute(
+            "UPDATE holdings SET shares = shares + ?, price = ? WHERE user_id = ? AND symbol = ? AND shares >= ?",
+            shares,
+            price,
+            user_id,
+            symbol,
+            -shares,
+        )
+        if debited != 1:
+            if not db.execute("SELECT 1 FROM holdings WHERE user_id = ? AND symbol = ?", user_id, symbol):
+                raise TradeError("You do not own any shares of this stock.")
+            raise TradeError("You do not have this amount of shares.")
+        db.execute(
+            "DELETE FROM holdings WHERE user_id = ? AND symbol = ? AND shares = 0", user_id, symbol
+        )
+        db.execute("UPDATE users SET cash = cash + ? WHERE id = ?", value, user_id)
+
+    transaction_id = db.execute(
+        "INSERT INTO transactions (user_id, symbol, shares, price, date) VALUES (?, ?, ?, ?, ?)",
+        user_id,
+        symbol,
+        shares,
+        price,
+        date,
+    )
+    if shares > 0:
+        lots.record_buy(db, user_id, symbol, shares, price, date)
+    else:
+        lots.record_sell(db, user_id, symbol, -shares, price, date, transaction_id)
+    return transaction_id
+
+
+def execute_basket(db, user_id, orders, prices):
+    """
+    Execute orders, a list of (symbol, shares), all-or-nothing at prices ({symbol: cents}).
+
+    Orders are checked in the order given against the cash and holdings left
+    by the orders before them, so sells listed first can fund later buys. If
+    any order fails nothing is written and BasketError carries the per-order
+    results. Otherwise cash, holdings, the ledger and tax lots are updated in
+    one transaction and a result dict per order is returned, each with the
+    new transactions row id.
+    """
+    if not orders or any(shares == 0 for _, shares in orders):
+        raise ValueError("orders must be non-empty with non-zero shares")
+    return _with_retries(db, lambda: _execute_basket(db, user_id, orders, prices))
+
+
+def _execute_basket(db, user_id, orders, prices):
+    # Under BEGIN IMMEDIATE nobody else can write, so plain reads are a consistent snapshot
+    symbols = list(dict.fromkeys(symbol for symbol, _ in orders))
+    cash = db.execute("SELECT cash FROM users WHERE id = ?", user_id, tuples=True)[0][0]
+    placeholders = ",".join("?" * len(symbols))
+    positions = dict(
+        db.execute(
+            f"SELECT symbol, shares FROM holdings WHERE user_id = ? AND symbol IN ({placeholders})",
+            user_id,
+            *symbols,
+            tuples=True,
+        )
+    )
+
+    results = []
+    for symbol, shares in orders:
+        price = prices[symbol]
+        error = None
+        if shares > 0 and shares * price > cash:
+            error = "Not Enough cash."
+        elif shares < 0 and not positions.get(symbol):
+            error = "You do not own any shares of this stock."
+        elif shares < 0 and positions[symbol] < -shares:
+            error = "You do not have this amount of shares."
+        else:
+            cash -= shares * price
+            positions[symbol] = positions.get(symbol, 0) + shares
+        results.append({"symbol": symbol, "shares": shares, "price": price, "error": error})
+    if any(result["error"] for result in results):
+        raise BasketError(results)
+
+    date = int(time.time())
+    last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM transactions", tuples=True)[0][0]
+    db.execute("UPDATE users SET cash = ? WHERE id = ?", cash, user_id)
+    db.executemany(
+        "INSERT INTO holdings (user_id, symbol, shares, price) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id, symbol) DO UPDATE SET shares = excluded.shares, price = excluded.price",
+        [(user_id, symbol, positions[symbol], prices[symbol]) for symbol in symbols if positions[symbol]],
+    )
+    db.executemany(
+        "DELETE FROM holdings WHERE user_id = ? AND symbol = ?",
+        [(user_id, symbol) for symbol in symbols if not positions[symbol]],
+    )
+    db.executemany(
+        "INSERT INTO transactions (user_id, symbol, shares, price, date) VALUES (?, ?, ?, ?, ?)",
+        [(user_id, symbol, shares, prices[symbol], date) for symbol, shares in orders],
+    )
+
+    # We hold the write lock, so the rows just inserted are exactly the ids above last_id
+    ids = db.execute(
+        "SELECT id FROM transactions WHERE user_id = ? AND id > ? ORDER BY id", user_id, last_id, tuples=True
+    )
+    method = lots.saved_method(db)
+    for (symbol, shares), (transaction_id,), result in zip(orders, ids, results):
+        result["id"] = transaction_id
+        if shares > 0:
+            lots.record_buy(db, user_id, symbol, shares, prices[symbol], date, method)
+        else:
+            lots.record_sell(db, user_id, symbol, -shares, prices[symbol], date, transaction_id, method)
+    return results
@@ -0,0 +1,94 @@
+"""
+Vectorized portfolio valuation.
+
+A user's open tax lots (see lots.py) are loaded into NumPy arrays, already
+grouped by symbol by the lots_user_symbol index, and reduced per symbol with
+np.add.reduceat, so the cost is a handful of array passes regardless of how
+many lots there are. Amounts are in cents.
+"""
+import numpy as np
+
+import lots
+from helpers import lookup_many, to_cents
+
+
+def load_lots(db, user_id):
+    """Return the user's open lots as (symbols, shares, costs) arrays, ordered by symbol."""
+    rows = db.execute(
+        "SELECT symbol, shares, cost FROM lots WHERE user_id = ? ORDER BY symbol", user_id, tuples=True
+    )
+    if not rows:
+        return np.array([], dtype=str), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    symbols, shares, costs = zip(*rows)
+    return np.array(symbols), np.array(shares, dtype=np.int64), np.array(costs, dtype=np.int64)
+
+
+def compute(symbols, shares, costs, quotes, last_prices=None, realized=None):
+    """
+    Reduce open-lot arrays to per-symbol positions.
+
+    quotes maps symbol to its current price in cents, or None when unknown.
+    In that case the price from last_prices is used and the row is flagged
+    stale. realized maps symbol to realized gains in cents. Returns a dict of
+    equal-length arrays keyed by column name.
+    """
+    last_prices = last_prices or {}
+    realized = realized or {}
+    if len(symbols) > 1 and not (symbols[:-1] <= symbols[1:]).all():
+        order = np.argsort(symbols, kind="stable")
+        symbols, shares, costs = symbols[order], shares[order], costs[order]
+
+    # Each run of equal symbols is one position
+    starts = np.flatnonzero(np.r_[len(symbols) > 0, symbols[1:] != symbols[:-1]])
+    names = symbols[starts]
+    count = len(names)
+    if count:
+        held = np.add.reduceat(shares, starts).astype(float)
+        basis = np.add.reduceat(costs, starts).astype(float)
+    else:
+        held = basis = np.zeros(0)
+
+    current = np.array([quotes.get(name) or np.nan for name in names], dtype=float)
+    stale = np.isnan(current)
+    fallback = np.array([last_prices.get(name, 0) for name in names], dtype=float)
+    current = np.where(stale, fallback, current)
+
+    average_cost = np.divide(basis, held, out=np.zeros(count), where=held > 0)
+    market_value = held * current
+    return {
+        "symbol": names,
+        "shares": held.astype(np.int64),
+        "price": current,
+        "stale": stale,
+        "average_cost": average_cost,
+        "market_value": market_value,
+        "unrealized": market_value - basis,
+        "realized": np.array([realized.get(name, 0) for name in names], dtype=float),
+    }
+
+
+def value_portfolio(db, user_id, quote=lookup_many):
+    """Value the user's portfolio at current prices with one batched quote fetch."""
+    symbols, shares, costs = load_lots(db, user_id)
+    names = sorted(set(symbols.tolist()))
+    quotes = {
+        symbol: to_cents(stock["price"]) if stock else None
+        for symbol, stock in quote(names).items()
+    } if names else {}
+    last_prices = dict(
+        db.execute("SELECT symbol, price FROM holdings WHERE user_id = ?", user_id, tuples=True)
+    )
+    realized = lots.realized_by_symbol(db, user_id)
+    columns = compute(symbols, shares, costs, quotes, last_prices, realized)
+
+    positions = [dict(zip(columns, row)) for row in zip(*(columns[c].tolist() for c in columns))]
+    cash = db.execute("SELECT cash FROM users WHERE id = ?", user_id)[0]["cash"]
+    market_value = float(columns["market_value"].sum())
+    return {
+        "positions": positions,
+        "cash": cash,
+        "market_value": market_value,
+        "unrealized": float(columns["unrealized"].sum()),
+        "realized": float(sum(realized.values())),
+        "equity": cash + market_value,
+    }